@@ -1,12 +1,15 @@
 import streamlit as st
+import functools
+import json
+import logging
 import os
-import io
-from PIL import Image
 import time
-import base64
-from utils.image_processing import preprocess_image
-from utils.gemini_api import analyze_injury, generate_first_aid, get_chatbot_response
-from utils.location_services import find_nearby_hospitals
+
+from utils.metrics import estimate_size, registry, SIZE_BUCKETS
+
+# Heavy modules (PIL, the Gemini SDK, folium) are imported inside the code
+# paths that need them, and process-wide objects are created once through
+# st.cache_resource, so a rerun only pays for the widgets it actually draws.
 
 # Set page configuration
 st.set_page_config(
@@ -15,212 +18,101 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state variables
-if 'image' not in st.session_state:
-    st.session_state.image = None
-if 'analysis_result' not in st.session_state:
-    st.session_state.analysis_result = None
-if 'first_aid' not in st.session_state:
-    st.session_state.first_aid = None
-if 'severity' not in st.session_state:
-    st.session_state.severity = None
-if 'hospitals' not in st.session_state:
-    st.session_state.hospitals = None
-if 'chatbot_history' not in st.session_state:
-    st.session_state.chatbot_history = []
-if 'loading' not in st.session_state:
-    st.session_state.loading = False
-if 'user_lat' not in st.session_state:
-    st.session_state.user_lat = 28.610532  # Default to IITM Janakpuri
-if 'user_lng' not in st.session_state:
-    st.session_state.user_lng = 77.101927  # Default to IITM Janakpuri
+logger = logging.getLogger("aidly")
 
-# Header
-st.title("🚑 Aidly")
-st.markdown("**Emergency medical guidance using AI**")
+SESSION_DEFAULTS = {
+    'image': None,
+    'image_ids': {},
+    'image_check': None,
+    'analysis_result': None,
+    'first_aid': None,
+    'severity': None,
+    'hospitals': None,
+    'hospitals_radius': None,
+    'chatbot_history': [],
+    'messages': [],
+    'loading': False,
+    'chat_context': None,
+    'chat_answers': None,
+    'recommendations': None,
+    'recent_captures': None,
+    'user_lat': 28.610532,  # Default to IITM Janakpuri
+    'user_lng': 77.101927,  # Default to IITM Janakpuri
+}
 
-# Sidebar content
-with st.sidebar:
-    # About Section with minimal styling
-    st.markdown("""
-        # <span style='color: #FF4B4B; font-size: 24px;'>🚑 About Aidly</span>
-    """, unsafe_allow_html=True)
-    
-    st.markdown("<br>", unsafe_allow_html=True)  # Add space
-    st.markdown("### What is Aidly?")
-    
-    st.markdown("""
-        <p style='margin: 15px 0 25px 0; line-height: 1.6;'>
-        Aidly is your AI-powered emergency medical assistant, providing immediate guidance for injuries using advanced computer vision and artificial intelligence.
-        </p>
-    """, unsafe_allow_html=True)
-    
-    # Key Features section
-    st.markdown("""
-        <div style='background-color: #e8f4f9; padding: 20px; border-radius: 10px; margin: 25px 0;'>
-            <h3 style='margin-bottom: 15px;'>Key Features</h3>
-            <div style='line-height: 2.2;'>
-                • 📸 Upload or capture injury images<br>
-                • 🤖 Get AI-powered analysis<br>
-                • 🏥 Locate nearby hospitals<br>
-                • 💬 Chat with AI for guidance<br>
-                • ⚠️ Severity assessment<br>
-                • 📋 First aid instructions
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # Emergency Numbers section
-    st.markdown("""
-        <div style='background-color: #ffe8ec; padding: 20px; border-radius: 10px; margin: 25px 0;'>
-            <h3 style='margin-bottom: 15px;'>Emergency Numbers</h3>
-            <div style='line-height: 2.2;'>
-                • 🚑 Ambulance: 108<br>
-                • 🆘 National Emergency: 112<br>
-                • 👶 Pregnancy: 102<br>
-                • 👮 Police: 100<br>
-                • 🚒 Fire: 101
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # Disclaimer section
-    st.markdown("""
-        <div style='background-color: #fff3cd; padding: 20px; border-radius: 10px; margin: 25px 0;'>
-            <h3 style='margin-bottom: 15px;'>⚠️ Important Disclaimer</h3>
-            <p style='color: #cc0000; margin-bottom: 15px; line-height: 1.6;'>
-                This app provides first aid guidance only. Always seek professional medical help in emergencies.
-            </p>
-            <p style='color: #666666; font-size: 0.9em; line-height: 1.6;'>
-                The AI analysis and recommendations are meant to assist, not replace, professional medical advice.
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
-
-# Main content
-tab1, tab2, tab3 = st.tabs(["📸 Analyze Injury", "🏥 Find Hospitals", "💬 Emergency Chat"])
+# Mirrored to the shared store in the multi-worker deployment, so a session
+# survives reconnecting to a different worker
+SHARED_SESSION_KEYS = (
+    'image', 'image_check', 'analysis_result', 'first_aid', 'severity',
+    'hospitals', 'hospitals_radius', 'messages', 'chat_context', 'user_lat', 'user_lng',
+)
 
-# Tab 1: Analyze Injury
-with tab1:
-    st.header("Upload or capture an image of the injury")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
-        if uploaded_file is not None:
-            try:
-                # Check file size (200MB limit)
-                file_size = len(uploaded_file.getvalue()) / (1024 * 1024)  # Convert to MB
-                if file_size > 200:
-                    st.error("File size exceeds 200MB limit")
-                else:
-                    # Reset the file pointer
-                    uploaded_file.seek(0)
-                    # Open and process image
-                    image = Image.open(uploaded_file)
-                    # Convert to RGB if needed
-                    if image.mode in ('RGBA', 'LA', 'P'):
-                        image = image.convert('RGB')
-                    # Store in session state
-                    st.session_state.image = image
-                    # Display image
-                    st.image(image, caption="Uploaded Image", width=400)
-            except Exception as e:
-                st.error(f"Error processing image: {str(e)}")
-                print(f"Detailed error: {str(e)}")  # For debugging
-    
-    with col2:
-        camera_photo = st.camera_input("Or take a photo")
-        if camera_photo is not None:
-            try:
-                image = Image.open(camera_photo)
-                if image.mode in ('RGBA', 'LA', 'P'):
-                    image = image.convert('RGB')
-                st.session_state.image = image
-            except Exception as e:
-                st.error(f"Error processing camera photo: {str(e)}")
-    
-    analyze_button = st.button("Analyze Injury", type="primary", use_container_width=True)
-    
-    if analyze_button and st.session_state.image is not None:
-        with st.spinner("Analyzing the injury..."):
-            st.session_state.loading = True
-            
-            # Preprocess the image
-            preprocessed_img = preprocess_image(st.session_state.image)
-            
-            # Analyze the injury using Gemini API
-            analysis_result = analyze_injury(preprocessed_img)
-            st.session_state.analysis_result = analysis_result
-            
-            # Generate severity score (1-10)
-            severity = int(analysis_result.get('severity_score', 5))
-            st.session_state.severity = severity
-            
-            # Generate first aid instructions
-            first_aid = generate_first_aid(analysis_result)
-            st.session_state.first_aid = first_aid
-            
-            st.session_state.loading = False
-    
-    # Display results if available
-    if st.session_state.analysis_result:
-        st.markdown("---")
-        st.header("Analysis Results")
-        
-        col1, col2 = st.columns([1, 2])
-        
-        with col1:
-            st.subheader("Injury Assessment")
-            st.markdown(f"**Identified Condition:** {st.session_state.analysis_result.get('condition', 'Unknown')}")
-            
-            # Display severity with appropriate color
-            severity = st.session_state.severity
-            severity_color = "green"
-            if severity > 3:
-                severity_color = "orange"
-            if severity > 7:
-                severity_color = "red"
-            
-            st.markdown(f"**Severity Score:** <span style='color:{severity_color};font-size:24px;font-weight:bold;'>{severity}/10</span>", unsafe_allow_html=True)
-            
-            if severity > 7:
-                st.error("⚠️ HIGH SEVERITY: Seek immediate medical attention!")
-        
-        with col2:
-            st.subheader("First Aid Instructions")
-            st.markdown(st.session_state.first_aid)
-        
-        # For high severity cases, automatically show hospital information
-        if severity > 7:
-            st.markdown("---")
-            st.subheader("⚠️ Nearby Hospitals")
-            st.info("Please enable location services to find nearby hospitals")
-            
-            if st.button("Find Nearby Hospitals"):
-                with st.spinner("Locating nearby hospitals..."):
-                    hospitals = find_nearby_hospitals()
-                    st.session_state.hospitals = hospitals
-            
-            if st.session_state.hospitals:
-                for hospital in st.session_state.hospitals[:3]:
-                    st.markdown(f"**{hospital['name']}**  \n{hospital['address']}  \nDistance: {hospital['distance']}  \nPhone: {hospital.get('phone', 'N/A')}")
-                    if 'mappls_directions_url' in hospital:
-                        st.markdown(f"[Get Directions (Mappls)]({hospital['mappls_directions_url']})")
-                    elif 'directions_url' in hospital:
-                        st.markdown(f"[Get Directions (Google Maps)]({hospital['directions_url']})")
-                    st.markdown("---")
+SIDEBAR_HTML = """
+# <span style='color: #FF4B4B; font-size: 24px;'>🚑 About Aidly</span>
 
-# Tab 2: Find Hospitals
-with tab2:
-    st.header("Find Nearby Hospitals")
-    
-    # Location access component
-    st.info("Please allow location access to find nearby hospitals. If location access is denied, IITM Janakpuri will be used as the reference point.")
-    
-    # Add JavaScript to get user's location
-    location_js = """
+<br>
+
+### What is Aidly?
+
+<p style='margin: 15px 0 25px 0; line-height: 1.6;'>
+Aidly is your AI-powered emergency medical assistant, providing immediate guidance for injuries using advanced computer vision and artificial intelligence.
+</p>
+
+<div style='background-color: #e8f4f9; padding: 20px; border-radius: 10px; margin: 25px 0;'>
+    <h3 style='margin-bottom: 15px;'>Key Features</h3>
+    <div style='line-height: 2.2;'>
+        • 📸 Upload or capture injury images<br>
+        • 🤖 Get AI-powered analysis<br>
+        • 🏥 Locate nearby hospitals<br>
+        • 💬 Chat with AI for guidance<br>
+        • ⚠️ Severity assessment<br>
+        • 📋 First aid instructions
+    </div>
+</div>
+
+<div style='background-color: #ffe8ec; padding: 20px; border-radius: 10px; margin: 25px 0;'>
+    <h3 style='margin-bottom: 15px;'>Emergency Numbers</h3>
+    <div style='line-height: 2.2;'>
+        • 🚑 Ambulance: 108<br>
+        • 🆘 National Emergency: 112<br>
+        • 👶 Pregnancy: 102<br>
+        • 👮 Police: 100<br>
+        • 🚒 Fire: 101
+    </div>
+</div>
+
+<div style='background-color: #fff3cd; padding: 20px; border-radius: 10px; margin: 25px 0;'>
+    <h3 style='margin-bottom: 15px;'>⚠️ Important Disclaimer</h3>
+    <p style='color: #cc0000; margin-bottom: 15px; line-height: 1.6;'>
+        This app provides first aid guidance only. Always seek professional medical help in emergencies.
+    </p>
+    <p style='color: #666666; font-size: 0.9em; line-height: 1.6;'>
+        The AI analysis and recommendations are meant to assist, not replace, professional medical advice.
+    </p>
+</div>
+"""
+
+FOOTER_HTML = """
+<div style="text-align: center">
+    <p>⚠️ <b>IMPORTANT:</b> This app provides first aid guidance only. Always seek professional medical help in emergencies.</p>
+    <p>© 2023 Aidly | Indian Emergency Services: 112 (National Emergency), 108 (Ambulance), 102 (Pregnancy)</p>
+</div>
+"""
+
+HOSPITALS_TAB = "🏥 Find Hospitals"
+DEFAULT_SEARCH_RADIUS_KM = 5
+
+# Hospitals listed beside the map; the map itself shows every result
+HOSPITAL_LIST_LIMIT = 20
+
+# Learned chat answers to opening questions survive restarts here
+ANSWER_CACHE_PATH = os.environ.get(
+    'AIDLY_ANSWER_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.aidly_cache', 'chat_answers.json'),
+)
+
+# JavaScript to get user's location
+LOCATION_JS = """
     <script>
     function getLocation() {
         if (navigator.geolocation) {
@@ -278,148 +170,546 @@ with tab2:
         <div id="location-status" style="margin-top: 8px; font-style: italic;">Click button to detect location</div>
     </div>
     """
-    
-    st.components.v1.html(location_js, height=100)
-    
+
+
+# Initialize session state variables
+for key, value in SESSION_DEFAULTS.items():
+    if key not in st.session_state:
+        st.session_state[key] = value.copy() if isinstance(value, (list, dict)) else value
+
+@st.cache_resource
+def get_shared_store():
+    """Store shared by all app workers (AIDLY_SHARED_STORE), or None for a single process."""
+    from utils.shared_store import get_shared_store as open_shared_store
+    return open_shared_store()
+
+@st.cache_resource
+def get_analysis_cache():
+    """Analysis results shared by every session in this process, and across workers if configured."""
+    store = get_shared_store()
+    if store is not None:
+        from utils.shared_store import SharedAnalysisCache
+        return SharedAnalysisCache(store, max_entries=256, ttl_seconds=6 * 3600)
+    from utils.analysis_cache import AnalysisCache
+    return AnalysisCache(max_entries=256, ttl_seconds=6 * 3600)
+
+def get_recent_captures():
+    """This session's recently analyzed captures, for near-duplicate reuse."""
+    if st.session_state.recent_captures is None:
+        from utils.pretriage import RecentCaptures
+        st.session_state.recent_captures = RecentCaptures(max_entries=32)
+    return st.session_state.recent_captures
+
+@st.cache_resource
+def get_answer_cache():
+    """Curated first aid answers plus model answers to opening questions, shared and persisted.
+
+    Only questions asked with no injury analysis and no earlier turns are
+    learned here, so an entry depends on nothing but the question.
+    """
+    import atexit
+    from utils.semantic_cache import SemanticCache
+    cache = SemanticCache(path=ANSWER_CACHE_PATH, max_entries=1000, threshold=0.75)
+    atexit.register(cache.save)
+    return cache
+
+def get_session_answers():
+    """This session's own model answers, keyed on the injury analysis they were generated with."""
+    if st.session_state.chat_answers is None:
+        from utils.semantic_cache import SemanticCache
+        st.session_state.chat_answers = SemanticCache(faq_path=None, max_entries=50, threshold=0.75)
+    return st.session_state.chat_answers
+
+@st.cache_resource(max_entries=2)
+def get_hospital_index(store_version):
+    """Spatial index over the local hospital data, built once per store version.
+
+    Prefers the memory-mapped hospital store and falls back to the plain
+    dataset file; returns None when there is no local data at all.
+    """
+    from utils.hospital_index import DEFAULT_DATASET_PATH, HospitalIndex
+    if store_version is not None:
+        from utils.hospital_store import HospitalStore
+        return HospitalIndex(HospitalStore(version=store_version))
+    if os.path.exists(DEFAULT_DATASET_PATH):
+        return HospitalIndex.from_file(DEFAULT_DATASET_PATH)
+    return None
+
+@st.cache_resource
+def start_hospital_refresher():
+    """Keep the hospital store fresh from a background thread, never at request time.
+
+    Opt-in with AIDLY_HOSPITAL_REFRESH_HOURS: a refresh queries the public
+    Overpass endpoint for the whole configured region.
+    """
+    interval_hours = float(os.environ.get('AIDLY_HOSPITAL_REFRESH_HOURS', 0))
+    if interval_hours <= 0:
+        return None
+    from utils.hospital_store import HospitalStoreRefresher
+    refresher = HospitalStoreRefresher(interval_hours=interval_hours)
+    refresher.start()
+    return refresher
+
+@st.cache_resource
+def start_store_purger():
+    """Drop expired sessions and analyses from the shared store; one worker is enough."""
+    store = get_shared_store()
+    if store is None or os.environ.get('AIDLY_WORKER_ID', '0') != '0':
+        return None
+    from utils.shared_store import StorePurger
+    purger = StorePurger(store)
+    purger.start()
+    return purger
+
+@st.cache_resource
+def start_metrics():
+    """Export stage timings, cache hit rates and scheduler state.
+
+    AIDLY_METRICS_PORT serves /metrics (Prometheus) and /metrics.json;
+    AIDLY_PROFILE_INTERVAL_MS additionally starts the sampling profiler,
+    whose collapsed stacks are served from /profile.
+    """
+    from utils import metrics
+    from utils.scheduler import get_scheduler
+
+    def cache_stats(cache):
+        return lambda: {f'aidly_cache_{k}': v for k, v in cache.stats().items()}
+
+    registry.register_collector('analysis_cache', cache_stats(get_analysis_cache()))
+    registry.register_collector('chat_answer_cache', cache_stats(get_answer_cache()))
+    registry.register_collector('hospital_recommendations', cache_stats(get_recommender()))
+    registry.register_collector(
+        'scheduler', lambda: {f'aidly_scheduler_{k}': v for k, v in get_scheduler().stats().items()}
+    )
+
+    interval_ms = float(os.environ.get('AIDLY_PROFILE_INTERVAL_MS', 0))
+    if interval_ms > 0:
+        metrics.start_profiler(interval=interval_ms / 1000)
+    port = os.environ.get('AIDLY_METRICS_PORT')
+    if port:
+        return metrics.start_metrics_server(int(port))
+    return None
+
+@st.cache_resource
+def get_gemini_model():
+    """Shared Gemini client, created on first use."""
+    from utils.gemini_stream import get_model
+    return get_model()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_hospital_map(location_cell, radius_km, results_hash, _hospitals):
+    """Map HTML without the user's own position, cached per (location cell, radius, result set) across sessions."""
+    from utils.map_render import build_map_html, cell_center
+    with registry.span('map_build'):
+        return build_map_html(*cell_center(location_cell), _hospitals)
+
+@st.cache_resource
+def get_recommender():
+    """Background hospital recommendations for critical cases, cached per grid cell."""
+    from utils.recommendations import HospitalRecommender
+    return HospitalRecommender()
+
+def hospital_fetcher():
+    """``fetch(lat, lng, radius_km)`` over the local index, or the location service without one."""
+    from utils.hospital_store import current_version
+    index = get_hospital_index(current_version())
+    if index is None:
+        from utils.backends import find_nearby_hospitals
+        return lambda lat, lng, radius_km: find_nearby_hospitals(radius_km=radius_km)
+    return index.within
+
+def show_all_hospitals():
+    """Button callback: search the current radius, emergency care first, and open the hospitals tab."""
+    radius_km = st.session_state.hospitals_radius or DEFAULT_SEARCH_RADIUS_KM
+    st.session_state.hospitals = search_hospitals(radius_km=radius_km, emergency_first=True)
+    st.session_state.hospitals_radius = radius_km
+    st.session_state.active_tab = HOSPITALS_TAB
+
+def search_hospitals(radius_km, emergency_first=False):
+    """Hospitals near the user, from the local index when a dataset is available."""
+    from utils.hospital_store import current_version
+    index = get_hospital_index(current_version())
+    if index is None:
+        # No local data yet (first boot before the store is built)
+        from utils.backends import find_nearby_hospitals
+        with registry.span('find_nearby_hospitals'):
+            return find_nearby_hospitals(radius_km=radius_km)
+    user_lat = st.session_state.user_lat
+    user_lng = st.session_state.user_lng
+    with registry.span('hospital_index_query'):
+        return index.within(user_lat, user_lng, radius_km, emergency_first=emergency_first)
+
+def chat_summarizer():
+    """Summarize evicted chat turns with the model, at background priority.
+
+    ConversationContext calls it from its own background thread, so a turn
+    that triggers compaction never waits behind other model calls.
+    """
+    from functools import partial
+    from utils.gemini_stream import summarize_conversation
+    from utils.scheduler import PRIORITY_BACKGROUND, get_scheduler
+    return partial(get_scheduler().call, summarize_conversation, priority=PRIORITY_BACKGROUND)
+
+def _owned_elsewhere(owner):
+    """True if ``owner`` (``worker:session``) is a live session other than this one."""
+    from streamlit import runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    worker_id, _, session_id = owner.partition(':')
+    # A session on another worker is only reconnected to here when that worker is down
+    return (worker_id == os.environ.get('AIDLY_WORKER_ID', '0')
+            and session_id != get_script_run_ctx().session_id
+            and runtime.get_instance().is_active_session(session_id))
+
+def attach_shared_session():
+    """Restore this tab's session from the shared store on its first run, then keep mirroring it.
+
+    A tab is identified by the HttpOnly ``aidly_session`` cookie the
+    utils.cluster proxy sets plus a random ``tab`` query parameter, so a
+    reload or a reconnect routed to another worker picks up where it left
+    off. Other tabs of the same browser get their own state; a tab opened
+    from a copy of a live tab's URL starts fresh instead of sharing it.
+    """
+    store = get_shared_store()
+    if store is None or 'session_sync' in st.session_state:
+        return
+    import re
+    from uuid import uuid4
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from utils.cluster import SESSION_COOKIE
+    from utils.shared_store import SessionSync, session_key
+
+    browser_id = st.context.cookies.get(SESSION_COOKIE)
+    tab_id = st.query_params.get('tab')
+    sync = None
+    if browser_id and tab_id and re.fullmatch(r'[0-9a-f]{32}', tab_id):
+        sync = SessionSync(store, session_key(browser_id, tab_id), SHARED_SESSION_KEYS)
+        owner = sync.owner()
+        if owner is not None and _owned_elsewhere(owner):
+            sync = None
+        else:
+            restored = sync.restore()
+            if restored.get('chat_context') is not None:
+                restored['chat_context'].summarizer = chat_summarizer()
+            for key, value in restored.items():
+                st.session_state[key] = value
+    if sync is None:
+        tab_id = uuid4().hex
+        if browser_id:
+            st.query_params['tab'] = tab_id
+            session_id = session_key(browser_id, tab_id)
+        else:
+            # Not behind the cluster proxy: mirror the session, but only under a private id
+            session_id = tab_id
+        sync = SessionSync(store, session_id, SHARED_SESSION_KEYS)
+    sync.claim(f"{os.environ.get('AIDLY_WORKER_ID', '0')}:{get_script_run_ctx().session_id}")
+    st.session_state.session_sync = sync
+
+def persist_session():
+    """Write changed shared keys to the shared store (no-op for a single process)."""
+    sync = st.session_state.get('session_sync')
+    if sync is not None:
+        sync.save(st.session_state)
+
+def on_new_image(file, source):
+    """Return True if ``file`` is new for its input widget (``source``)."""
+    file_id = getattr(file, 'file_id', None) or file.name
+    if file_id == st.session_state.image_ids.get(source):
+        return False
+    st.session_state.image_ids[source] = file_id
+    return True
+
+def store_image(file):
+    """Downscale ``file`` and keep only the compact encoded buffer in session state."""
+    from utils.image_ingest import ingest_image, load_image
+    from utils.pretriage import assess_image
+    st.session_state.image_check = None
+    with registry.span('image_decode'):
+        st.session_state.image = ingest_image(file)
+    # Score the capture right away so a blurry or dark photo is flagged
+    # before the user even presses Analyze
+    with registry.span('pretriage'):
+        st.session_state.image_check = assess_image(load_image(st.session_state.image))
+
+# Each tab is a fragment: interacting with a widget inside a tab reruns only
+# that tab instead of the whole script. A fragment rerun skips the end of
+# the script, so each one persists the shared session state itself.
+
+def fragment(func):
+    @functools.wraps(func)
+    def run():
+        try:
+            func()
+        finally:
+            persist_session()
+    return st.fragment(run)
+
+@fragment
+def analyze_injury_tab():
+    st.header("Upload or capture an image of the injury")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
+        if uploaded_file is not None:
+            try:
+                # Decode only when a new file arrives; reruns reuse the stored buffer
+                if on_new_image(uploaded_file, 'upload'):
+                    store_image(uploaded_file)
+                # Display image
+                st.image(st.session_state.image, caption="Uploaded Image", width=400)
+            except Exception as e:
+                st.session_state.image_ids.pop('upload', None)
+                st.error(f"Error processing image: {str(e)}")
+                logger.exception("Could not process uploaded image")
+
+    with col2:
+        camera_photo = st.camera_input("Or take a photo")
+        if camera_photo is not None:
+            try:
+                if on_new_image(camera_photo, 'camera'):
+                    store_image(camera_photo)
+            except Exception as e:
+                st.session_state.image_ids.pop('camera', None)
+                st.error(f"Error processing camera photo: {str(e)}")
+                logger.exception("Could not process camera photo")
+
+    if uploaded_file is None and camera_photo is None and st.session_state.image is not None:
+        # The input widgets are cleared while another tab is open; the
+        # stored image is still what Analyze will use
+        st.image(st.session_state.image, caption="Current Image", width=400)
+
+    image_check = st.session_state.image_check
+    unusable = image_check is not None and image_check['reason'] is not None
+    analyze_anyway = False
+    if unusable:
+        st.warning(image_check['reason'])
+        # Pre-triage can misjudge a real injury photo; never let it block analysis
+        analyze_anyway = st.button("Analyze anyway", use_container_width=True)
+
+    analyze_button = st.button(
+        "Analyze Injury", type="primary", use_container_width=True, disabled=unusable,
+    )
+    run_analysis = (analyze_button or analyze_anyway) and st.session_state.image is not None
+
+    # Display results while they stream in, or from a previous run
+    if not (run_analysis or st.session_state.analysis_result):
+        return
+
+    st.markdown("---")
+    st.header("Analysis Results")
+
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        st.subheader("Injury Assessment")
+        assessment_placeholder = st.empty()
+
+    with col2:
+        st.subheader("First Aid Instructions")
+        first_aid_placeholder = st.empty()
+
+    def show_assessment(analysis_result):
+        # Generate severity score (1-10)
+        severity = int(analysis_result.get('severity_score', 5))
+        st.session_state.analysis_result = analysis_result
+        st.session_state.severity = severity
+
+        with assessment_placeholder.container():
+            st.markdown(f"**Identified Condition:** {analysis_result.get('condition', 'Unknown')}")
+
+            # Display severity with appropriate color
+            severity_color = "green"
+            if severity > 3:
+                severity_color = "orange"
+            if severity > 7:
+                severity_color = "red"
+
+            st.markdown(f"**Severity Score:** <span style='color:{severity_color};font-size:24px;font-weight:bold;'>{severity}/10</span>", unsafe_allow_html=True)
+
+            if severity > 7:
+                st.error("⚠️ HIGH SEVERITY: Seek immediate medical attention!")
+
+    def on_assessment(analysis_result):
+        show_assessment(analysis_result)
+        if st.session_state.severity > 7:
+            # Start ranking hospitals now, while first aid is still streaming
+            get_recommender().prefetch(hospital_fetcher(), st.session_state.user_lat, st.session_state.user_lng)
+
+    def show_first_aid(first_aid):
+        first_aid_placeholder.markdown(first_aid + "▌")
+
+    if run_analysis:
+        from utils.analysis_pipeline import AnalysisPipeline
+        from utils.cpu_pool import get_cpu_pool
+        from utils.pretriage import UnusableImage
+
+        st.session_state.loading = True
+        st.session_state.first_aid = None
+        assessment_placeholder.info("Analyzing the injury...")
+        first_aid_placeholder.info("First aid instructions will appear here as soon as the assessment is ready.")
+
+        get_gemini_model()
+        pipeline = AnalysisPipeline(
+            cache=get_analysis_cache(), captures=get_recent_captures(), pool=get_cpu_pool(),
+        )
+        try:
+            analysis_result, first_aid = pipeline.run_sync(
+                st.session_state.image,
+                on_assessment=on_assessment,
+                on_first_aid=show_first_aid,
+                force=analyze_anyway,
+            )
+            st.session_state.first_aid = first_aid
+        except UnusableImage as e:
+            assessment_placeholder.warning(str(e))
+            first_aid_placeholder.empty()
+        finally:
+            st.session_state.loading = False
+    else:
+        show_assessment(st.session_state.analysis_result)
+
+    if st.session_state.first_aid:
+        first_aid_placeholder.markdown(st.session_state.first_aid)
+
+    severity = st.session_state.severity or 0
+
+    # For high severity cases, automatically show hospital information
+    if severity > 7:
+        st.markdown("---")
+        st.subheader("⚠️ Recommended Hospitals")
+        st.info("Please enable location services to find nearby hospitals")
+
+        # Ranked once per assessment and location, not on every rerun
+        condition = st.session_state.analysis_result.get('condition')
+        ranking_key = (condition, st.session_state.user_lat, st.session_state.user_lng)
+        recommended = []
+        if st.session_state.recommendations and st.session_state.recommendations[0] == ranking_key:
+            recommended = st.session_state.recommendations[1]
+        else:
+            try:
+                with st.spinner("Ranking nearby hospitals..."), registry.span('hospital_recommendations'):
+                    recommended = get_recommender().recommend(
+                        hospital_fetcher(),
+                        st.session_state.user_lat,
+                        st.session_state.user_lng,
+                        condition,
+                        timeout=10,
+                    )
+                st.session_state.recommendations = (ranking_key, recommended)
+            except Exception:
+                logger.exception("Could not rank nearby hospitals")
+
+        for hospital in recommended:
+            tags = []
+            if hospital.get('emergency'):
+                tags.append("24/7 emergency")
+            if hospital['matched_specialties']:
+                tags.append(", ".join(hospital['matched_specialties']))
+            st.markdown(f"**{hospital['name']}**  \n{hospital['address']}  \nDistance: {hospital['distance']}  \nPhone: {hospital.get('phone', 'N/A')}")
+            if tags:
+                st.caption(" · ".join(tags))
+            if 'mappls_directions_url' in hospital:
+                st.markdown(f"[Get Directions (Mappls)]({hospital['mappls_directions_url']})")
+            elif 'directions_url' in hospital:
+                st.markdown(f"[Get Directions (Google Maps)]({hospital['directions_url']})")
+            st.markdown("---")
+
+        # The callback runs before the tabs are built, so it can switch to
+        # the hospitals tab, which shows every result on the map
+        st.button("Show All Nearby Hospitals", on_click=show_all_hospitals)
+
+@fragment
+def find_hospitals_tab():
+    st.header("Find Nearby Hospitals")
+
+    # Location access component
+    st.info("Please allow location access to find nearby hospitals. If location access is denied, IITM Janakpuri will be used as the reference point.")
+
+    st.components.v1.html(LOCATION_JS, height=100)
+
     # Handle custom event for location
     if st.session_state.get('user_location_captured'):
         location_data = st.session_state.user_location_captured
         st.session_state.user_lat = location_data['lat']
         st.session_state.user_lng = location_data['lng']
         st.session_state.user_location_captured = None  # Reset after handling
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col2:
         search_radius = st.slider(
             "Search radius (km)",
             min_value=1,
             max_value=20,
-            value=5,
+            value=st.session_state.hospitals_radius or DEFAULT_SEARCH_RADIUS_KM,
             help="Adjust the radius to find hospitals within this distance"
         )
-    
+
     if st.button("Search Hospitals", use_container_width=True):
         with st.spinner("Searching for nearby hospitals..."):
-            hospitals = find_nearby_hospitals(radius_km=search_radius)
+            hospitals = search_hospitals(radius_km=search_radius)
             st.session_state.hospitals = hospitals
-    
+            st.session_state.hospitals_radius = search_radius
+
     if st.session_state.hospitals:
         st.subheader("Nearest Medical Facilities")
-        
+
         # Display map
         try:
-            import folium
-            from streamlit_folium import folium_static
-            from folium import plugins
-            
-            # Get user's location
+            from utils.map_render import add_user_location, location_cell, render_hospital_card, results_digest
+
+            hospitals = st.session_state.hospitals
             user_lat = st.session_state.user_lat
             user_lng = st.session_state.user_lng
-            
-            # Create the map centered on user location
-            m = folium.Map(
-                location=[user_lat, user_lng],
-                zoom_start=13,
-                tiles="OpenStreetMap"
+            base_html, map_name = render_hospital_map(
+                location_cell(user_lat, user_lng),
+                st.session_state.hospitals_radius,
+                results_digest(hospitals),
+                hospitals,
             )
-            
-            # Add user location marker with a custom icon
-            folium.Marker(
-                [user_lat, user_lng],
-                popup="Your Location",
-                icon=folium.Icon(color="blue", icon="info-sign"),
-            ).add_to(m)
-            
-            # Create a feature group for hospitals
-            hospital_group = folium.FeatureGroup(name="Hospitals")
-            
-            # Add hospital markers
-            for hospital in st.session_state.hospitals:
-                # Create popup content with HTML formatting
-                popup_html = f"""
-                <div style="width: 250px; padding: 10px;">
-                    <h4 style="color: #FF4B4B; margin: 0 0 10px 0;">{hospital['name']}</h4>
-                    <p style="margin: 5px 0;"><b>Distance:</b> {hospital['distance']}</p>
-                    <p style="margin: 5px 0;"><b>Phone:</b> {hospital.get('phone', 'N/A')}</p>
-                    <p style="margin: 5px 0;"><b>Address:</b> {hospital['address']}</p>
-                    <div style="margin-top: 10px;">
-                        <a href="{hospital['directions_url']}" target="_blank" style="color: #FF4B4B;">Get Directions</a>
-                    </div>
-                </div>
-                """
-                
-                # Add hospital marker
-                folium.Marker(
-                    location=[hospital['lat'], hospital['lng']],
-                    popup=folium.Popup(popup_html, max_width=300),
-                    icon=folium.Icon(color="red", icon="plus", prefix='fa'),
-                    tooltip=hospital['name']
-                ).add_to(hospital_group)
-            
-            # Add the hospital group to the map
-            hospital_group.add_to(m)
-            
-            # Add layer control
-            folium.LayerControl().add_to(m)
-            
-            # Add fullscreen button
-            plugins.Fullscreen().add_to(m)
-            
-            # Fit bounds to include all markers
-            bounds = [[hospital['lat'], hospital['lng']] for hospital in st.session_state.hospitals]
-            bounds.append([user_lat, user_lng])
-            m.fit_bounds(bounds)
-            
+            # The shared map knows nothing about this user; add their marker here
+            map_html = add_user_location(base_html, map_name, user_lat, user_lng)
+
             # Create columns for map and list view
             map_col, list_col = st.columns([2, 1])
-            
+
             with map_col:
                 # Display the map with a fixed height
                 st.write("### Interactive Map")
-                folium_static(m, width=800, height=500)
-            
+                st.components.v1.html(map_html, width=800, height=500)
+
             with list_col:
                 st.markdown("""
                 <div style="background-color: #FF4B4B; padding: 15px; border-radius: 10px; margin-bottom: 20px;">
                     <h2 style="color: white; margin: 0; text-align: center;">Nearby Hospitals</h2>
                 </div>
                 """, unsafe_allow_html=True)
-                
-                if not st.session_state.hospitals:
+
+                if not hospitals:
                     st.info("No hospitals found within the selected radius. Try increasing the search radius.")
                 else:
-                    for i, hospital in enumerate(st.session_state.hospitals):
-                        with st.expander(f"{i+1}. {hospital['name']}", expanded=True):
-                            st.markdown(f"""
-                            <div style="background-color: #f0f2f6; padding: 15px; border-radius: 10px; margin: 10px 0;">
-                                <h4 style="color: #FF4B4B; margin: 0 0 10px 0;">{hospital['name']}</h4>
-                                <p style="margin: 5px 0;"><b>📍 Distance:</b> {hospital['distance']}</p>
-                                <p style="margin: 5px 0;"><b>📞 Phone:</b> {hospital.get('phone', 'N/A')}</p>
-                                <p style="margin: 5px 0;"><b>🏥 Address:</b> {hospital['address']}</p>
-                                <p style="margin: 5px 0;"><b>⚕️ Specialties:</b> {', '.join(hospital.get('specialties', []))}</p>
-                                {f"<p style='margin: 5px 0;'><b>🚨 Emergency Services:</b> Available</p>" if hospital.get('emergency', False) else ""}
-                                <div style="margin-top: 10px;">
-                                    <a href="{hospital['directions_url']}" target="_blank" style="background-color: #FF4B4B; color: white; padding: 8px 16px; text-decoration: none; border-radius: 4px;">Get Directions</a>
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
-        
+                    # The map shows every result; the list only the closest ones
+                    for i, hospital in enumerate(hospitals[:HOSPITAL_LIST_LIMIT]):
+                        with st.expander(f"{i+1}. {hospital['name']}", expanded=i < 5):
+                            st.markdown(render_hospital_card(hospital), unsafe_allow_html=True)
+                    if len(hospitals) > HOSPITAL_LIST_LIMIT:
+                        st.caption(f"{len(hospitals) - HOSPITAL_LIST_LIMIT} more facilities are shown on the map.")
+
         except Exception as e:
             st.error(f"Could not display map: {str(e)}")
-            # Print detailed error for debugging
-            import traceback
-            st.write("Detailed error:")
-            st.code(traceback.format_exc())
+            logger.exception("Could not display hospital map")
 
-# Tab 3: Emergency Chat
-with tab3:
+@fragment
+def emergency_chat_tab():
     st.header("Emergency Guidance Chat")
     st.info("Ask questions about first aid or emergency procedures")
 
-    # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if st.session_state.chat_context is None:
+        from utils.chat_context import ConversationContext
+        st.session_state.chat_context = ConversationContext(summarizer=chat_summarizer())
+    chat_context = st.session_state.chat_context
 
     # Display chat messages
     for message in st.session_state.messages:
@@ -428,47 +718,146 @@ with tab3:
 
     # Chat input
     if prompt := st.chat_input("Type your question here"):
+        from utils.gemini_stream import stream_chatbot_response
+        from utils.scheduler import PRIORITY_CHAT, get_scheduler
+
         # Add user message to chat history
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Get AI response with loading animation
+        # Stream the AI response as it is generated
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("🤔 Thinking...")
-            
+
+            answers = get_answer_cache()
+            session_answers = get_session_answers()
             try:
-                # Get the actual response
-                response = get_chatbot_response(prompt)
-                
-                # Display response with typing effect
-                full_response = ""
-                for chunk in response.split():
-                    full_response += chunk + " "
-                    message_placeholder.markdown(full_response + "▌")
-                    time.sleep(0.02)  # Slightly faster typing speed
-                
-                # Final display without cursor
-                message_placeholder.markdown(response)
-                
+                analysis = st.session_state.analysis_result
+                # An opening question with no analysis depends only on its own
+                # text, so its answer is shared; anything else stays in this
+                # session, keyed on the analysis it was answered with
+                opening = not analysis and not chat_context.turns and not chat_context.summary
+                answer_key = json.dumps(analysis, sort_keys=True, default=str) if analysis else None
+
+                # Send a bounded context: pinned analysis, rolling summary, recent turns
+                chat_context.pin(analysis)
+                context = chat_context.render()
+
+                # Common questions are answered locally without a model call
+                cached = answers.lookup(prompt) or session_answers.lookup(prompt, context=answer_key)
+                if cached is not None:
+                    response = cached[0]
+                    message_placeholder.markdown(response)
+                else:
+                    response = ""
+                    last_render = 0.0
+                    started = time.perf_counter()
+                    with registry.span('chat_response'):
+                        chunks = get_scheduler().stream(
+                            stream_chatbot_response, prompt,
+                            context=context, priority=PRIORITY_CHAT,
+                        )
+                        for chunk in chunks:
+                            if not response:
+                                registry.observe(
+                                    'aidly_first_token_seconds', time.perf_counter() - started, stage='chat_response'
+                                )
+                            response += chunk
+                            # Repaint at most every 50ms so long answers stay cheap to render
+                            now = time.monotonic()
+                            if now - last_render >= 0.05:
+                                message_placeholder.markdown(response + "▌")
+                                last_render = now
+
+                    # Final display without cursor
+                    message_placeholder.markdown(response)
+
+                    if opening:
+                        answers.add(prompt, response)
+                    else:
+                        session_answers.add(prompt, response, context=answer_key)
+
                 # Add to chat history
                 st.session_state.messages.append({"role": "assistant", "content": response})
-                
+                chat_context.add_turn("user", prompt)
+                chat_context.add_turn("assistant", response)
+
             except Exception as e:
                 error_msg = f"Error getting AI response: {str(e)}"
                 message_placeholder.error(error_msg)
-                import traceback
-                st.error(traceback.format_exc())
+                logger.exception("Chat response failed")
+
+attach_shared_session()
+start_hospital_refresher()
+start_store_purger()
+start_metrics()
+
+# Header
+st.title("🚑 Aidly")
+st.markdown("**Emergency medical guidance using AI**")
+
+# Sidebar content
+with st.sidebar:
+    st.markdown(SIDEBAR_HTML, unsafe_allow_html=True)
+
+    # Cache diagnostics
+    with st.expander("Diagnostics"):
+        for label, cache in (
+            ("Analysis cache", get_analysis_cache()),
+            ("Chat answer cache", get_answer_cache()),
+            ("Hospital recommendations", get_recommender()),
+        ):
+            cache_stats = cache.stats()
+            st.caption(
+                f"{label}: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries)"
+            )
+        from utils.scheduler import get_scheduler
+        scheduler_stats = get_scheduler().stats()
+        st.caption(
+            f"Model scheduler: {scheduler_stats['active']} active, {scheduler_stats['waiting']} waiting, "
+            f"{scheduler_stats['coalesced']} coalesced, {scheduler_stats['retries']} retries"
+        )
+        for histogram in registry.snapshot()['histograms']:
+            if histogram['name'] == 'aidly_stage_seconds':
+                st.caption(
+                    f"{histogram['labels']['stage']}: {histogram['count']} calls, "
+                    f"p95 ≤ {histogram['p95'] * 1000:.0f} ms"
+                )
+
+# Main content. The tabs track which one is selected and rerun on a switch,
+# so only the open tab's body runs: the map and the chat history are not
+# rebuilt while another tab is in view.
+tab1, tab2, tab3 = st.tabs(
+    ["📸 Analyze Injury", HOSPITALS_TAB, "💬 Emergency Chat"],
+    key='active_tab', on_change='rerun',
+)
+
+# Tab 1: Analyze Injury
+if tab1.open:
+    with tab1:
+        analyze_injury_tab()
+
+# Tab 2: Find Hospitals
+if tab2.open:
+    with tab2:
+        find_hospitals_tab()
+
+# Tab 3: Emergency Chat
+if tab3.open:
+    with tab3:
+        emergency_chat_tab()
 
 # Footer
 st.markdown("---")
-st.markdown(
-    """
-    <div style="text-align: center">
-        <p>⚠️ <b>IMPORTANT:</b> This app provides first aid guidance only. Always seek professional medical help in emergencies.</p>
-        <p>© 2023 Aidly | Indian Emergency Services: 112 (National Emergency), 108 (Ambulance), 102 (Pregnancy)</p>
-    </div>
-    """, 
-    unsafe_allow_html=True
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
+
+# Session memory, sampled once per full run
+registry.observe(
+    'aidly_session_state_bytes',
+    sum(estimate_size(st.session_state.get(key)) for key in SESSION_DEFAULTS),
+    buckets=SIZE_BUCKETS,
 )
+persist_session()
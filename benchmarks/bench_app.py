@@ -0,0 +1,99 @@
+"""Cold-start and per-rerun timing for app.py.
+
+Runs the script headlessly through streamlit.testing and reports how long the
+first run takes in a fresh interpreter (cold start) and how long subsequent
+reruns take, both for a plain rerun and for a widget interaction.
+
+    python benchmarks/bench_app.py --reruns 30
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('AIDLY_HOSPITAL_REFRESH_HOURS', '0')
+
+HOSPITALS_TAB = "🏥 Find Hospitals"
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def run_once():
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    elapsed = time.perf_counter() - start
+    return check(at), elapsed
+
+
+def check(at):
+    if at.exception:
+        raise SystemExit(f"app raised: {at.exception[0].message}")
+    return at
+
+
+def cold_start(samples):
+    timings = []
+    for _ in range(samples):
+        out = subprocess.run(
+            [sys.executable, __file__, '--cold-once'],
+            check=True, capture_output=True, text=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def reruns(count):
+    at, _ = run_once()
+    plain = []
+    for _ in range(count):
+        start = time.perf_counter()
+        at.run()
+        plain.append(time.perf_counter() - start)
+        check(at)
+
+    # The radius slider lives in the hospitals tab, which only runs while
+    # selected; AppTest does not report the selection back, so set it each run
+    at.session_state['active_tab'] = HOSPITALS_TAB
+    check(at.run())
+    slider = []
+    for i in range(count):
+        at.session_state['active_tab'] = HOSPITALS_TAB
+        start = time.perf_counter()
+        at.slider[0].set_value(1 + i % 20).run()
+        slider.append(time.perf_counter() - start)
+        check(at)
+    return plain, slider
+
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<22} n={len(timings):<4} p50={statistics.median(timings) * 1000:8.1f} ms"
+          f"  p95={p95 * 1000:8.1f} ms  max={timings[-1] * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cold-samples', type=int, default=3)
+    parser.add_argument('--reruns', type=int, default=20)
+    parser.add_argument('--cold-once', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_once:
+        _, elapsed = run_once()
+        print(elapsed)
+        return
+
+    summarize('cold start', cold_start(args.cold_samples))
+    plain, slider = reruns(args.reruns)
+    summarize('rerun', plain)
+    summarize('rerun (slider change)', slider)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""End-to-end latency benchmark for the app.py flows.
+
+Drives the real script headlessly through streamlit.testing AppTest against
+the deterministic fake backends (AIDLY_BACKEND=fake), and reports p50 / p95 /
+p99 latency for:
+
+- image analysis: Analyze Injury click through streamed first aid
+- hospital search at several radii
+- a multi-turn emergency chat
+- a plain rerun with all of the above on screen
+
+plus the pickled size of one session's state and the peak Python heap
+allocated while running the flows (tracemalloc).
+
+    python benchmarks/bench_e2e.py --iterations 20
+    python benchmarks/bench_e2e.py --save-baseline bench_baseline.json
+    python benchmarks/bench_e2e.py --baseline bench_baseline.json --tolerance 0.2
+
+With --baseline, the run exits non-zero if any flow's p95 is more than
+``tolerance`` slower than the baseline, so it can gate performance changes.
+Fake latencies are tuned through the AIDLY_FAKE_* variables documented in
+utils/fake_backends.py.
+"""
+import argparse
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configure the app before any of its modules are imported
+_tmp = tempfile.mkdtemp(prefix='aidly-bench-')
+os.environ.setdefault('AIDLY_BACKEND', 'fake')
+os.environ.setdefault('AIDLY_HOSPITAL_REFRESH_HOURS', '0')
+os.environ.setdefault('AIDLY_HOSPITAL_STORE', os.path.join(_tmp, 'store'))
+os.environ.setdefault('AIDLY_HOSPITALS_PATH', os.path.join(_tmp, 'no-dataset.json'))
+os.environ.setdefault('AIDLY_ANSWER_CACHE', os.path.join(_tmp, 'chat_answers.json'))
+
+APP_PATH = os.path.join(ROOT, 'app.py')
+HOSPITALS_TAB = "🏥 Find Hospitals"
+CHAT_TAB = "💬 Emergency Chat"
+RADII = (1, 5, 10, 20)
+CHAT_PROMPTS = [
+    "My friend cut his hand on broken glass and it is bleeding a lot",
+    "How long should I keep pressing on the wound?",
+    "The cloth is soaked through, what now?",
+    "Should I give him water?",
+    "He is feeling dizzy and pale",
+    "How to stop bleeding",
+    "The ambulance is 20 minutes away, what should I watch for?",
+    "Can I use a belt as a tourniquet?",
+]
+
+SESSION_KEYS = ('image', 'analysis_result', 'first_aid', 'severity', 'hospitals',
+                'messages', 'chat_context', 'chatbot_history')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def sample_image(i):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (1024, 768), (180 + i % 50, 120, 110))
+    ImageDraw.Draw(image).ellipse((300 + i, 200, 700, 500), fill=(150, 20, 30))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def new_app():
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    return check(at.run())
+
+
+def check(at):
+    # A run that raised is usually fast, so it must never be timed as a result
+    if at.exception:
+        raise SystemExit(f"app raised: {at.exception[0].message}")
+    return at
+
+
+def in_tab(at, label):
+    # Only the selected tab's body runs. AppTest does not report the tab
+    # selection back like a browser does, so select it before every run.
+    at.session_state['active_tab'] = label
+    return at
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def timed(action):
+    start = time.perf_counter()
+    check(action())
+    return time.perf_counter() - start
+
+
+def session_bytes(at):
+    state = {}
+    for key in SESSION_KEYS:
+        try:
+            value = at.session_state[key]
+            pickle.dumps(value)
+        except Exception:
+            continue
+        state[key] = value
+    return len(pickle.dumps(state))
+
+
+def run_flows(iterations):
+    results = {'analysis': [], 'hospital_search': [], 'chat_turn': [], 'rerun': []}
+    session_sizes = []
+
+    for i in range(iterations):
+        at = new_app()
+
+        # Upload is simulated by placing an ingested image in session state;
+        # each iteration uses a distinct image so the analysis cache misses
+        at.session_state['image'] = sample_image(i)
+        results['analysis'].append(timed(lambda: button(at, "Analyze Injury").click().run()))
+        if at.session_state['analysis_result'] is None:
+            raise SystemExit("analysis produced no result")
+
+        check(in_tab(at, HOSPITALS_TAB).run())
+        for radius in RADII:
+            check(in_tab(at, HOSPITALS_TAB).slider[0].set_value(radius).run())
+            results['hospital_search'].append(
+                timed(lambda: button(in_tab(at, HOSPITALS_TAB), "Search Hospitals").click().run())
+            )
+
+        check(in_tab(at, CHAT_TAB).run())
+        for prompt in CHAT_PROMPTS:
+            results['chat_turn'].append(
+                timed(lambda: in_tab(at, CHAT_TAB).chat_input[0].set_value(f"{prompt} ({i})").run())
+            )
+
+        results['rerun'].append(timed(at.run))
+        session_sizes.append(session_bytes(at))
+
+    return results, session_sizes
+
+
+def summarize(results):
+    return {
+        name: {
+            'n': len(values),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+        for name, values in results.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--baseline', help="Fail if p95 regresses against this JSON summary")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--save-baseline', help="Write this run's summary to a JSON file")
+    args = parser.parse_args()
+
+    try:
+        # The app imports the analysis pipeline lazily; fail before timing anything
+        import utils.analysis_pipeline  # noqa: F401
+    except ImportError as e:
+        raise SystemExit(f"The analysis flow cannot run: {e}")
+
+    tracemalloc.start()
+    results, session_sizes = run_flows(args.iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize(results)
+    summary['memory'] = {
+        'session_state_kb': sum(session_sizes) / len(session_sizes) / 1024,
+        'peak_heap_mb': peak / (1024 * 1024),
+    }
+
+    for name, stats in summary.items():
+        if name == 'memory':
+            continue
+        print(f"{name:<16} n={stats['n']:<4} p50={stats['p50_ms']:8.1f} ms  "
+              f"p95={stats['p95_ms']:8.1f} ms  p99={stats['p99_ms']:8.1f} ms")
+    print(f"session state    {summary['memory']['session_state_kb']:.1f} KB per session, "
+          f"peak heap {summary['memory']['peak_heap_mb']:.1f} MB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, stats in summary.items():
+            if name == 'memory' or name not in baseline:
+                continue
+            limit = baseline[name]['p95_ms'] * (1 + args.tolerance)
+            if stats['p95_ms'] > limit:
+                regressions.append(f"{name}: p95 {stats['p95_ms']:.1f} ms > {limit:.1f} ms")
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
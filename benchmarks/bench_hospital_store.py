@@ -0,0 +1,81 @@
+"""Loader benchmark for the offline hospital store.
+
+Writes a synthetic national-scale dataset both as a JSON file and as a
+memory-mapped store, then compares how long each takes to open, how long
+the spatial index takes to build on top, and how long a query takes.
+
+    python benchmarks/bench_hospital_store.py --rows 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.hospital_index import HospitalIndex, load_hospital_records  # noqa: E402
+from utils.hospital_store import HospitalStore, write_store  # noqa: E402
+
+SPECIALTIES = ['Emergency', 'Trauma', 'Cardiology', 'Orthopedics', 'Burns', 'Pediatrics', 'Neurology']
+
+
+def synthetic_records(rows, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'name': f"Facility {i}",
+            'address': f"{rng.randint(1, 999)} Main Road, District {i % 700}",
+            'phone': f"+91 11 {rng.randint(10000000, 99999999)}",
+            'lat': rng.uniform(8.0, 35.0),
+            'lng': rng.uniform(68.5, 97.0),
+            'specialties': rng.sample(SPECIALTIES, rng.randint(0, 3)),
+            'emergency': rng.random() < 0.4,
+        }
+        for i in range(rows)
+    ]
+
+
+def timed(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'hospitals.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+        store_path = os.path.join(tmp, 'store')
+        write_store(records, store_path)
+
+        loaded, json_ms = timed(lambda: load_hospital_records(json_path))
+        store, store_ms = timed(lambda: HospitalStore(store_path))
+        _, json_index_ms = timed(lambda: HospitalIndex(loaded), repeat=3)
+        index, store_index_ms = timed(lambda: HospitalIndex(store), repeat=3)
+        _, store_total_ms = timed(lambda: HospitalIndex(HospitalStore(store_path)), repeat=3)
+        _, query_ms = timed(lambda: index.within(28.61, 77.10, 20), repeat=50)
+
+    print(f"rows: {args.rows}")
+    print(f"open JSON dataset:          {json_ms:9.2f} ms")
+    print(f"open memory-mapped store:   {store_ms:9.2f} ms")
+    print(f"build index (JSON records): {json_index_ms:9.2f} ms")
+    print(f"build index (store):        {store_index_ms:9.2f} ms")
+    print(f"open store + build index:   {store_total_ms:9.2f} ms")
+    print(f"20 km radius query:         {query_ms:9.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Throughput scaling of the multi-worker deployment (utils.cluster).
+
+Starts the cluster with 1, 2, 4, ... workers against the fake backends and
+drives it through the load balancer with concurrent websocket clients that
+speak Streamlit's own protocol: each client opens a session and requests
+full script runs back to back, as a browser does on every interaction.
+Reports completed script runs per second per worker count, the speedup over
+one worker and the scaling efficiency (speedup / workers).
+
+    python benchmarks/bench_throughput.py --workers 1 2 4 --clients 16 --seconds 20
+    python benchmarks/bench_throughput.py --workers 1 4 --min-efficiency 0.7
+
+Script runs are CPU-bound, so scaling stops at the number of physical cores;
+the report prints os.cpu_count() next to the results. With
+--min-efficiency the run exits non-zero if the largest worker count scales
+worse than that, so it can gate deployment changes.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.cluster import wait_healthy  # noqa: E402
+
+
+def cluster_env(tmp):
+    env = dict(os.environ)
+    env.setdefault('AIDLY_BACKEND', 'fake')
+    env.setdefault('AIDLY_HOSPITAL_REFRESH_HOURS', '0')
+    env.setdefault('AIDLY_HOSPITAL_STORE', os.path.join(tmp, 'store'))
+    env.setdefault('AIDLY_HOSPITALS_PATH', os.path.join(tmp, 'no-dataset.json'))
+    return env
+
+
+def start_cluster(workers, port, tmp):
+    command = [
+        sys.executable, '-m', 'utils.cluster',
+        '--workers', str(workers),
+        '--port', str(port),
+        '--host', '127.0.0.1',
+        '--store', 'sqlite:///' + os.path.join(tmp, f'shared-{workers}.db'),
+    ]
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=cluster_env(tmp),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    ports = [port + 1 + i for i in range(workers)]
+    if not all(wait_healthy(p) for p in ports) or not wait_healthy(port):
+        process.terminate()
+        raise SystemExit(f"cluster with {workers} workers did not start")
+    return process
+
+
+async def client(url, deadline, counts, latencies):
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    rerun = BackMsg()
+    rerun.rerun_script.query_string = ''
+    rerun.rerun_script.page_script_hash = ''
+    payload = rerun.SerializeToString()
+
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            await ws.send(payload)
+            while True:
+                message = ForwardMsg()
+                message.ParseFromString(await ws.recv())
+                if message.WhichOneof('type') == 'script_finished':
+                    break
+            counts[0] += 1
+            latencies.append(time.perf_counter() - start)
+
+
+async def drive(port, clients, seconds, warmup):
+    url = f'ws://127.0.0.1:{port}/_stcore/stream'
+    # Warm every worker's caches and imports before measuring
+    await asyncio.gather(*(client(url, time.monotonic() + warmup, [0], []) for _ in range(clients)))
+
+    counts, latencies = [0], []
+    start = time.monotonic()
+    await asyncio.gather(*(client(url, start + seconds, counts, latencies) for _ in range(clients)))
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    return counts[0] / elapsed, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent sessions")
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--min-efficiency', type=float, help="Fail if the largest worker count scales worse")
+    args = parser.parse_args()
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        raise SystemExit("The throughput benchmark needs the websockets package: pip install websockets")
+
+    tmp = tempfile.mkdtemp(prefix='aidly-throughput-')
+    results = {}
+    for workers in args.workers:
+        process = start_cluster(workers, args.port, tmp)
+        try:
+            results[workers] = asyncio.run(drive(args.port, args.clients, args.seconds, args.warmup))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    baseline = results[min(results)][0] / min(results)
+    print(f"{os.cpu_count()} CPUs, {args.clients} clients, {args.seconds:.0f}s per run")
+    for workers, (throughput, p95) in results.items():
+        speedup = throughput / baseline
+        print(f"workers={workers:<3} {throughput:8.1f} runs/s  p95={p95 * 1000:7.1f} ms  "
+              f"speedup={speedup:4.2f}x  efficiency={speedup / workers:4.0%}")
+
+    if args.min_efficiency is not None:
+        largest = max(results)
+        efficiency = results[largest][0] / baseline / largest
+        if efficiency < args.min_efficiency:
+            print(f"Scaling efficiency {efficiency:.0%} at {largest} workers is below {args.min_efficiency:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
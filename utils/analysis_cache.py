@@ -0,0 +1,83 @@
+"""Process-wide cache of injury analysis results.
+
+Entries are keyed by a hash of the *preprocessed* image, so the same photo
+submitted twice (or re-analyzed on a Streamlit rerun) skips analyze_injury
+and generate_first_aid entirely. The cache is bounded in size (LRU) and age
+(TTL) and is safe to share between sessions.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def image_digest(image):
+    """Return a stable hex digest for a preprocessed image.
+
+    Accepts whatever preprocess_image produces: a PIL image, a NumPy array or
+    raw bytes.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        h.update(image)
+    elif hasattr(image, 'tobytes') and hasattr(image, 'mode'):
+        # PIL image
+        h.update(f"{image.mode}:{image.size}".encode())
+        h.update(image.tobytes())
+    elif hasattr(image, 'tobytes') and hasattr(image, 'shape'):
+        # NumPy array
+        h.update(f"{image.dtype}:{image.shape}".encode())
+        h.update(image.tobytes())
+    else:
+        h.update(repr(image).encode())
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=256, ttl_seconds=6 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return ``(analysis_result, first_aid)`` for ``key`` or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, analysis_result, first_aid):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), (analysis_result, first_aid))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,145 @@
+"""Async pipeline behind the "Analyze Injury" button.
+
+The CPU-only pre-triage rejects unusable frames before anything is sent and
+crops the image to its region of interest. Decoding, pre-triage and
+preprocessing run in a worker thread, or in a process pool (utils.cpu_pool)
+so they do not hold the Streamlit process's GIL. The script thread stays
+free to paint. With an AnalysisCache, a previously seen image is answered
+without any model call. So is a near-identical capture recognized by the
+session's RecentCaptures. Otherwise the model calls go through the shared
+GeminiScheduler. The assessment is handed to the caller as soon as
+analyze_injury returns, then first aid is forwarded chunk by chunk, streamed
+at critical priority for high-severity injuries. Every stage is timed into
+utils.metrics.
+"""
+import asyncio
+import functools
+import time
+
+from utils.analysis_cache import image_digest
+from utils.image_ingest import load_image
+from utils.image_processing import preprocess_image
+from utils.backends import analyze_injury
+from utils.gemini_stream import stream_first_aid
+from utils.metrics import registry
+from utils.pretriage import assess_image, check_image, prepare_for_upload
+from utils.scheduler import PRIORITY_ANALYSIS, PRIORITY_CRITICAL, get_scheduler
+
+
+def prepare_image(image, force=False):
+    """Decode, pre-triage and preprocess one image (PIL image or ingested JPEG bytes).
+
+    Returns ``(preprocessed, report, timings)`` with stage timings in
+    seconds, so callers running this in another process can still record
+    them. Raises UnusableImage for frames that fail pre-triage, unless
+    ``force`` is set (the user chose to analyze the image anyway).
+    """
+    timings = {}
+    start = time.perf_counter()
+    if isinstance(image, (bytes, bytearray)):
+        image = load_image(image)
+        timings['image_load'] = time.perf_counter() - start
+        start = time.perf_counter()
+    report = assess_image(image) if force else check_image(image)
+    image = prepare_for_upload(image, report)
+    timings['pretriage'] = time.perf_counter() - start
+    start = time.perf_counter()
+    preprocessed = preprocess_image(image)
+    timings['preprocess_image'] = time.perf_counter() - start
+    return preprocessed, report, timings
+
+
+class AnalysisPipeline:
+    def __init__(self, cache=None, scheduler=None, captures=None, pool=None):
+        self.cache = cache
+        self.scheduler = scheduler or get_scheduler()
+        self.captures = captures
+        self.pool = pool
+
+    async def _call(self, func, *args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def _call_in_pool(self, func, *args):
+        if self.pool is None:
+            return await self._call(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(func, *args))
+
+    async def _iterate(self, chunks):
+        done = object()
+        try:
+            while True:
+                chunk = await self._call(next, chunks, done)
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            try:
+                chunks.close()
+            except (AttributeError, ValueError):
+                # ValueError: the worker thread is still inside next()
+                pass
+
+    async def run(self, image, on_assessment=None, on_first_aid=None, force=False):
+        """Analyze ``image`` and return ``(analysis_result, first_aid)``.
+
+        ``image`` is a PIL image or the JPEG bytes from ingest_image; bytes
+        are cheaper to hand to the process pool.
+
+        ``on_assessment(analysis_result)`` is called once the model has scored
+        the injury; ``on_first_aid(text_so_far)`` after every streamed chunk.
+        Both run on the event loop thread, i.e. the script thread. Raises
+        UnusableImage for frames that fail pre-triage, unless ``force`` is set.
+        """
+        preprocessed_img, report, timings = await self._call_in_pool(prepare_image, image, force)
+        for stage, seconds in timings.items():
+            registry.observe('aidly_stage_seconds', seconds, stage=stage)
+
+        cache_key = await self._call(image_digest, preprocessed_img)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is None and self.captures is not None:
+                duplicate_of = self.captures.find(report['dhash'], report['thumbnail'])
+                if duplicate_of is not None:
+                    cached = self.cache.get(duplicate_of)
+            if cached is not None:
+                registry.increment('aidly_analysis_total', source='cache')
+                analysis_result, first_aid = cached
+                if on_assessment is not None:
+                    on_assessment(analysis_result)
+                if on_first_aid is not None:
+                    on_first_aid(first_aid)
+                return analysis_result, first_aid
+
+        # Identical images analyzed concurrently (e.g. double clicks, reruns
+        # in other sessions) share one model call
+        with registry.span('analyze_injury'):
+            analysis_result = await self._call(
+                self.scheduler.call, analyze_injury, preprocessed_img,
+                priority=PRIORITY_ANALYSIS, key=('analyze_injury', cache_key),
+            )
+        registry.increment('aidly_analysis_total', source='model')
+        if on_assessment is not None:
+            on_assessment(analysis_result)
+
+        severity = int(analysis_result.get('severity_score', 5))
+        priority = PRIORITY_CRITICAL if severity > 7 else PRIORITY_ANALYSIS
+        first_aid = ""
+        started = time.perf_counter()
+        with registry.span('generate_first_aid'):
+            chunks = self.scheduler.stream(stream_first_aid, analysis_result, priority=priority)
+            async for chunk in self._iterate(chunks):
+                if not first_aid:
+                    registry.observe('aidly_first_token_seconds', time.perf_counter() - started, stage='generate_first_aid')
+                first_aid += chunk
+                if on_first_aid is not None:
+                    on_first_aid(first_aid)
+
+        if self.cache is not None:
+            self.cache.put(cache_key, analysis_result, first_aid)
+        if self.captures is not None:
+            self.captures.add(report['dhash'], report['thumbnail'], cache_key)
+        return analysis_result, first_aid
+
+    def run_sync(self, image, on_assessment=None, on_first_aid=None, force=False):
+        """Run the pipeline to completion from synchronous code."""
+        return asyncio.run(self.run(image, on_assessment, on_first_aid, force))
@@ -0,0 +1,20 @@
+"""Backend selection for model and location calls.
+
+Everything that calls Gemini or the location service imports it from here.
+``AIDLY_BACKEND=fake`` swaps in the deterministic stand-ins from
+utils.fake_backends for load tests and benchmarks.
+"""
+import os
+
+FAKE = os.environ.get('AIDLY_BACKEND', '').lower() == 'fake'
+
+if FAKE:
+    from utils.fake_backends import (  # noqa: F401
+        analyze_injury,
+        find_nearby_hospitals,
+        generate_first_aid,
+        get_chatbot_response,
+    )
+else:
+    from utils.gemini_api import analyze_injury, generate_first_aid, get_chatbot_response  # noqa: F401
+    from utils.location_services import find_nearby_hospitals  # noqa: F401
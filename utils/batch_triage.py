@@ -0,0 +1,276 @@
+"""Headless bulk triage for drills and offline evaluation.
+
+Analyzes a directory (or manifest) of injury images with the same
+preprocess_image, analyze_injury and stream_first_aid calls (and so the
+same first aid prompt) the app uses:
+
+- decoding, pre-triage and preprocessing run in a process pool, so blurry
+  or badly exposed frames are rejected without a model call;
+- model calls run on a bounded thread pool through the shared
+  GeminiScheduler (concurrency cap, retries, deadlines);
+- every result is appended to a JSONL file as soon as it is ready, so an
+  interrupted run resumes where it stopped;
+- optionally the results are also written to Parquet (needs pandas and
+  pyarrow).
+
+    python -m utils.batch_triage images/ --out triage.jsonl --workers 4 --concurrency 8
+    python -m utils.batch_triage manifest.txt --out triage.jsonl --parquet triage.parquet
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def collect_inputs(source):
+    """Return ``[(image_id, path)]`` for a directory or a manifest file.
+
+    A manifest is either plain text with one path per line or JSONL with
+    ``path`` and optional ``id`` fields; relative paths are resolved against
+    the manifest's directory.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+        return [(os.path.relpath(p, source), p) for p in sorted(paths)]
+
+    base = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                path = item['path']
+                image_id = str(item.get('id', path))
+            else:
+                path = image_id = line
+            inputs.append((image_id, os.path.join(base, path)))
+    return inputs
+
+
+def completed_ids(out_path):
+    """Image ids that already have a successful result in ``out_path``."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+
+def _ends_mid_line(path):
+    """True if ``path`` ends with a partially written line."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+    except FileNotFoundError:
+        return False
+
+
+def prepare_image(path):
+    """Process-pool worker: bounded decode, pre-triage and preprocess one image."""
+    from utils.analysis_pipeline import prepare_image as prepare
+    from utils.image_ingest import ingest_image
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        buffer = ingest_image(f)
+    ingested = time.perf_counter()
+    # Unusable frames fail here (recorded as errors) without a model call
+    preprocessed, _, timings = prepare(buffer)
+    return preprocessed, {
+        'decode_ms': ((ingested - start) + timings['image_load']) * 1000,
+        'pretriage_ms': timings['pretriage'] * 1000,
+        'preprocess_ms': timings['preprocess_image'] * 1000,
+    }
+
+
+def analyze_prepared(preprocessed):
+    """Thread-pool worker: model calls for one preprocessed image."""
+    from utils.analysis_cache import image_digest
+    from utils.backends import analyze_injury
+    from utils.gemini_stream import stream_first_aid
+    from utils.scheduler import PRIORITY_BACKGROUND, get_scheduler
+
+    scheduler = get_scheduler()
+    start = time.perf_counter()
+    analysis_result = scheduler.call(
+        analyze_injury, preprocessed,
+        priority=PRIORITY_BACKGROUND, key=('analyze_injury', image_digest(preprocessed)),
+    )
+    analyzed = time.perf_counter()
+    # The app streams first aid; join the same stream so the prompt matches
+    first_aid = "".join(scheduler.stream(stream_first_aid, analysis_result, priority=PRIORITY_BACKGROUND))
+    done = time.perf_counter()
+    timings = {'analyze_ms': (analyzed - start) * 1000, 'first_aid_ms': (done - analyzed) * 1000}
+    return analysis_result, first_aid, timings
+
+
+def run_batch(source, out_path, workers=None, concurrency=4, resume=True, on_progress=None):
+    """Triage every image in ``source`` and append results to ``out_path``.
+
+    Returns a summary dict with counts, elapsed time and images/sec.
+    """
+    inputs = collect_inputs(source)
+    done = completed_ids(out_path) if resume else set()
+    pending = [(image_id, path) for image_id, path in inputs if image_id not in done]
+
+    write_lock = threading.Lock()
+    counts = {'ok': 0, 'error': 0}
+    started = time.perf_counter()
+
+    mode = 'a' if resume else 'w'
+    partial_line = resume and _ends_mid_line(out_path)
+    with open(out_path, mode, encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=workers) as decode_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as model_pool:
+
+        if partial_line:
+            # Terminate the interrupted record so the next one starts on its own line
+            out.write('\n')
+
+        def write(record):
+            with write_lock:
+                out.write(json.dumps(record, default=str) + '\n')
+                out.flush()
+                counts[record['status']] += 1
+            if on_progress is not None:
+                on_progress(record)
+
+        def finish(image_id, path, prepare_timings, model_future):
+            try:
+                analysis_result, first_aid, model_timings = model_future.result()
+            except Exception as e:
+                write({'id': image_id, 'path': path, 'status': 'error', 'error': str(e), 'timings': prepare_timings})
+                return
+            write({
+                'id': image_id,
+                'path': path,
+                'status': 'ok',
+                'condition': analysis_result.get('condition', 'Unknown'),
+                'severity_score': analysis_result.get('severity_score'),
+                'analysis': analysis_result,
+                'first_aid': first_aid,
+                'timings': dict(prepare_timings, **model_timings),
+            })
+
+        # Keep a bounded number of decoded images waiting for the model so
+        # memory stays flat on large directories
+        max_buffered = concurrency * 2
+        queue = iter(pending)
+        decoding = {}
+        analyzing = set()
+
+        def refill():
+            while len(decoding) + len(analyzing) < max_buffered:
+                item = next(queue, None)
+                if item is None:
+                    return
+                decoding[decode_pool.submit(prepare_image, item[1])] = item
+
+        refill()
+        while decoding or analyzing:
+            finished, _ = wait(list(decoding) + list(analyzing), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in analyzing:
+                    analyzing.discard(future)
+                    continue
+                image_id, path = decoding.pop(future)
+                try:
+                    preprocessed, prepare_timings = future.result()
+                except Exception as e:
+                    write({'id': image_id, 'path': path, 'status': 'error', 'error': str(e)})
+                    continue
+                model_future = model_pool.submit(analyze_prepared, preprocessed)
+                model_future.add_done_callback(
+                    lambda f, i=image_id, p=path, t=prepare_timings: finish(i, p, t, f)
+                )
+                analyzing.add(model_future)
+            refill()
+
+    elapsed = time.perf_counter() - started
+    processed = counts['ok'] + counts['error']
+    return {
+        'total': len(inputs),
+        'skipped': len(inputs) - len(pending),
+        'ok': counts['ok'],
+        'error': counts['error'],
+        'elapsed_s': elapsed,
+        'images_per_sec': processed / elapsed if elapsed else 0.0,
+    }
+
+
+def write_parquet(jsonl_path, parquet_path):
+    try:
+        import pandas as pd
+    except ImportError:
+        raise SystemExit("Parquet output needs pandas and pyarrow: pip install pandas pyarrow")
+    records = []
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            timings = record.pop('timings', None) or {}
+            record.pop('analysis', None)
+            record.update(timings)
+            records.append(record)
+    pd.DataFrame.from_records(records).to_parquet(parquet_path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of injury images")
+    parser.add_argument('source', help="Directory of images, or a manifest (.txt paths or .jsonl)")
+    parser.add_argument('--out', default='triage_results.jsonl', help="JSONL output (appended to when resuming)")
+    parser.add_argument('--parquet', help="Also write the results to this Parquet file")
+    parser.add_argument('--workers', type=int, default=None, help="Decode/preprocess processes (default: CPU count)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent model calls")
+    parser.add_argument('--no-resume', action='store_true', help="Start over instead of skipping finished images")
+    args = parser.parse_args(argv)
+
+    # The scheduler cap is what actually bounds model calls
+    os.environ.setdefault('AIDLY_GEMINI_CONCURRENCY', str(args.concurrency))
+
+    def progress(record):
+        severity = record.get('severity_score', '-')
+        print(f"[{record['status']}] {record['id']} severity={severity}", file=sys.stderr)
+
+    summary = run_batch(
+        args.source, args.out,
+        workers=args.workers, concurrency=args.concurrency,
+        resume=not args.no_resume, on_progress=progress,
+    )
+    if args.parquet:
+        write_parquet(args.out, args.parquet)
+
+    print(
+        f"{summary['ok']} ok, {summary['error']} failed, {summary['skipped']} already done "
+        f"in {summary['elapsed_s']:.1f}s ({summary['images_per_sec']:.2f} images/sec)"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Token-budgeted conversation context for the Emergency Chat tab.
+
+Recent turns are kept verbatim until they exceed the budget; older turns are
+folded into a rolling summary in batches, so each request carries at most
+``token_budget`` tokens of history plus a bounded summary no matter how long
+the conversation runs. The latest injury analysis, when there is one, is
+pinned at the top of every request.
+
+Folding never waits on the model: evicted turns go into an extractive
+summary straight away, and a model summarizer, when given, refines it on a
+background thread. The refined summary replaces the extractive one on the
+first turn after it is ready.
+"""
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_refiner = ThreadPoolExecutor(max_workers=2, thread_name_prefix='aidly-summary')
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def extractive_summary(summary, turns, max_tokens):
+    """Fallback summarizer: keep the gist of each user question."""
+    lines = [summary] if summary else []
+    for turn in turns:
+        if turn['role'] != 'user':
+            continue
+        first_sentence = turn['content'].strip().split('\n')[0].split('. ')[0]
+        lines.append(f"- User asked: {first_sentence[:160]}")
+    text = "\n".join(lines)
+    max_chars = max_tokens * 4
+    if len(text) > max_chars:
+        # Keep the most recent part of the summary
+        text = text[-max_chars:]
+        text = text[text.find('\n') + 1:] if '\n' in text else text
+    return text
+
+
+class ConversationContext:
+    def __init__(self, token_budget=1500, summary_budget=300, summarizer=None):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        # summarizer(previous_summary, evicted_turns, max_tokens) -> str
+        self.summarizer = summarizer or extractive_summary
+        self.turns = deque()
+        self.summary = ""
+        self.pinned = None
+        self._turn_tokens = 0
+        # Future of the model summary that will replace self.summary
+        self._refining = None
+
+    def __getstate__(self):
+        # The summarizer is usually bound to a process-local scheduler; a
+        # context restored in another worker gets the extractive fallback
+        # until the app attaches its own. A pending refinement stays behind
+        # too; the extractive summary already covers those turns.
+        state = self.__dict__.copy()
+        state['summarizer'] = None
+        state['_refining'] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('_refining', None)
+        self.__dict__.update(state)
+        self.summarizer = self.summarizer or extractive_summary
+
+    def pin(self, analysis_result):
+        """Pin the current injury analysis (or clear it with None)."""
+        self.pinned = analysis_result
+
+    def add_turn(self, role, content):
+        self._apply_refined()
+        self.turns.append({'role': role, 'content': content})
+        self._turn_tokens += estimate_tokens(content)
+        if self._turn_tokens > self.token_budget:
+            self._compact()
+
+    def _compact(self):
+        # Evict down to half the budget so the summarizer runs once per
+        # batch of turns rather than on every new message
+        evicted = []
+        while self.turns and self._turn_tokens > self.token_budget // 2:
+            turn = self.turns.popleft()
+            self._turn_tokens -= estimate_tokens(turn['content'])
+            evicted.append(turn)
+        if not evicted:
+            return
+        previous = self.summary
+        self.summary = extractive_summary(previous, evicted, self.summary_budget)
+        if self.summarizer is not extractive_summary:
+            self._refining = _refiner.submit(
+                self._refine, self.summarizer, self._refining, previous, evicted, self.summary_budget
+            )
+
+    @staticmethod
+    def _refine(summarizer, pending, previous, evicted, max_tokens):
+        # Build on the refinement still in flight, if any, so batches folded
+        # in quick succession are all summarized by the model
+        if pending is not None:
+            try:
+                previous = pending.result()
+            except Exception:
+                pass
+        try:
+            return summarizer(previous, evicted, max_tokens)
+        except Exception:
+            return extractive_summary(previous, evicted, max_tokens)
+
+    def _apply_refined(self):
+        if self._refining is not None and self._refining.done():
+            self.summary = self._refining.result()
+            self._refining = None
+
+    def render(self):
+        """Context text to send ahead of the next question."""
+        self._apply_refined()
+        sections = []
+        if self.pinned:
+            analysis = json.dumps(self.pinned, default=str)
+            sections.append(f"Current injury analysis: {analysis}")
+        if self.summary:
+            sections.append(f"Summary of earlier conversation:\n{self.summary}")
+        if self.turns:
+            recent = "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in self.turns)
+            sections.append(f"Recent conversation:\n{recent}")
+        return "\n\n".join(sections)
+
+    def stats(self):
+        return {
+            'turns': len(self.turns),
+            'turn_tokens': self._turn_tokens,
+            'summary_tokens': estimate_tokens(self.summary) if self.summary else 0,
+            'summary_pending': self._refining is not None,
+        }
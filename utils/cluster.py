@@ -0,0 +1,269 @@
+"""Multi-worker deployment: several app processes behind a local load balancer.
+
+    python -m utils.cluster --workers 4 --port 8501
+    python -m utils.cluster --workers 4 --store redis://localhost:6379/0
+
+Each worker is a separate ``streamlit run app.py`` process on a private
+port, so script runs and image work use every core instead of sharing one
+GIL. A small asyncio TCP proxy on ``--port`` spreads connections over them:
+
+- a new browser goes to the worker with the fewest open connections and
+  gets an ``aidly_worker`` cookie pinning it there, so its page, websocket
+  and file uploads all reach the worker that owns its Streamlit session;
+- it also gets a random ``aidly_session`` cookie identifying the browser;
+  the app combines it with a per-tab id to name each tab's state in the
+  shared store. Both cookies are HttpOnly, so that state cannot be reached
+  from a URL, the history or page scripts;
+- if that worker is down, the browser is re-pinned to a healthy one and
+  its session is restored from the shared store (see utils.shared_store).
+
+Workers share state through AIDLY_SHARED_STORE (a local SQLite file by
+default), signed with AIDLY_SHARED_STORE_SECRET (random per run unless set).
+They share one cookie secret so XSRF tokens validate on any worker, and each
+get a small process pool for CPU-bound preprocessing (AIDLY_CPU_WORKERS).
+Only worker 0 refreshes the hospital store and purges expired shared
+entries. Crashed workers are restarted.
+"""
+import argparse
+import asyncio
+import os
+import re
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+DEFAULT_STORE = 'sqlite:///' + os.path.join(os.path.dirname(APP_PATH), '.aidly_cache', 'shared.db')
+
+WORKER_COOKIE = 'aidly_worker'
+SESSION_COOKIE = 'aidly_session'
+_COOKIE_RE = re.compile(rb'(?im)^cookie:.*?\b' + WORKER_COOKIE.encode() + rb'=(\d+)')
+_SESSION_COOKIE_RE = re.compile(rb'(?im)^cookie:.*?\b' + SESSION_COOKIE.encode() + rb'=[A-Za-z0-9_-]+')
+
+# How long a worker that refused a connection is skipped
+DOWN_SECONDS = 5
+# Minimum time between restarts of a crashing worker
+RESTART_SECONDS = 5
+CHUNK_BYTES = 64 * 1024
+
+
+def worker_env(index, store_url, cpu_workers, cookie_secret, store_secret):
+    env = dict(os.environ)
+    # Streamlit only accepts the cookie secret from config or the environment
+    env['STREAMLIT_SERVER_COOKIE_SECRET'] = cookie_secret
+    env['AIDLY_SHARED_STORE'] = store_url
+    env['AIDLY_SHARED_STORE_SECRET'] = store_secret
+    env['AIDLY_CPU_WORKERS'] = str(cpu_workers)
+    env['AIDLY_WORKER_ID'] = str(index)
+    if index > 0:
+        env['AIDLY_HOSPITAL_REFRESH_HOURS'] = '0'
+    if env.get('AIDLY_METRICS_PORT'):
+        env['AIDLY_METRICS_PORT'] = str(int(env['AIDLY_METRICS_PORT']) + index)
+    return env
+
+
+def start_worker(index, port, store_url, cpu_workers, cookie_secret, store_secret):
+    command = [
+        sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+        '--server.port', str(port),
+        '--server.address', '127.0.0.1',
+        '--server.headless', 'true',
+        '--browser.gatherUsageStats', 'false',
+    ]
+    return subprocess.Popen(command, env=worker_env(index, store_url, cpu_workers, cookie_secret, store_secret))
+
+
+def wait_healthy(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+class StickyProxy:
+    """Cookie-pinned, least-connections TCP proxy in front of the workers."""
+
+    def __init__(self, ports):
+        self.ports = ports
+        self.active = [0] * len(ports)
+        self._down_until = [0.0] * len(ports)
+
+    def _candidates(self, pinned):
+        now = time.monotonic()
+        healthy = [i for i in range(len(self.ports)) if self._down_until[i] <= now]
+        order = sorted(healthy, key=lambda i: self.active[i])
+        if pinned in healthy:
+            order.remove(pinned)
+            order.insert(0, pinned)
+        # Fall back to workers marked down rather than refusing outright
+        return order + [i for i in range(len(self.ports)) if i not in healthy]
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(CHUNK_BYTES)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+    async def _pipe_response(self, reader, writer, cookies):
+        # Pin the browser (and name its session) by adding cookies to the first response
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        status_line, _, rest = head.partition(b'\r\n')
+        headers = ''.join(f'Set-Cookie: {cookie}; Path=/; HttpOnly; SameSite=Lax\r\n' for cookie in cookies)
+        writer.write(status_line + b'\r\n' + headers.encode() + rest)
+        await self._pipe(reader, writer)
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        match = _COOKIE_RE.search(head)
+        pinned = int(match.group(1)) if match else None
+        for index in self._candidates(pinned):
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', self.ports[index])
+                break
+            except OSError:
+                self._down_until[index] = time.monotonic() + DOWN_SECONDS
+        else:
+            client_writer.write(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            client_writer.close()
+            return
+
+        cookies = []
+        if index != pinned:
+            cookies.append(f'{WORKER_COOKIE}={index}')
+        if not _SESSION_COOKIE_RE.search(head):
+            cookies.append(f'{SESSION_COOKIE}={secrets.token_urlsafe(32)}')
+
+        self.active[index] += 1
+        try:
+            upstream_writer.write(head)
+            if cookies:
+                responses = self._pipe_response(upstream_reader, client_writer, cookies)
+            else:
+                responses = self._pipe(upstream_reader, client_writer)
+            await asyncio.gather(self._pipe(client_reader, upstream_writer), responses)
+        finally:
+            self.active[index] -= 1
+            for writer in (upstream_writer, client_writer):
+                writer.close()
+
+
+class Cluster:
+    def __init__(self, workers, port, host='0.0.0.0', store_url=DEFAULT_STORE, cpu_workers=0, base_port=None):
+        self.workers = workers
+        self.port = port
+        self.host = host
+        self.store_url = store_url
+        self.cpu_workers = cpu_workers
+        base_port = base_port or port + 1
+        self.ports = [base_port + i for i in range(workers)]
+        self.cookie_secret = secrets.token_hex(32)
+        # Set it explicitly to keep shared sessions readable across restarts
+        self.store_secret = os.environ.get('AIDLY_SHARED_STORE_SECRET') or secrets.token_hex(32)
+        self.processes = []
+        self._started_at = [0.0] * workers
+
+    def _start(self, index):
+        self._started_at[index] = time.monotonic()
+        return start_worker(index, self.ports[index], self.store_url, self.cpu_workers, self.cookie_secret, self.store_secret)
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process.poll() is None or time.monotonic() - self._started_at[index] < RESTART_SECONDS:
+                    continue
+                print(f"worker {index} exited with {process.returncode}, restarting", file=sys.stderr)
+                self.processes[index] = self._start(index)
+
+    def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    async def serve(self, on_ready=None):
+        proxy = StickyProxy(self.ports)
+        # Bind first so a busy port fails before any worker is spawned
+        server = await asyncio.start_server(proxy.handle, self.host, self.port)
+        self.processes = [self._start(i) for i in range(self.workers)]
+        supervisor = asyncio.create_task(self._supervise())
+        try:
+            healthy = await asyncio.gather(*(asyncio.to_thread(wait_healthy, p) for p in self.ports))
+            if not all(healthy):
+                raise RuntimeError("Some workers did not become healthy; see their output above")
+            if on_ready is not None:
+                on_ready()
+            async with server:
+                await server.serve_forever()
+        finally:
+            supervisor.cancel()
+            self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several app workers behind a local load balancer")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--port', type=int, default=8501, help="Public port of the load balancer")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--base-port', type=int, help="First worker port (default: --port + 1)")
+    parser.add_argument('--store', default=os.environ.get('AIDLY_SHARED_STORE', DEFAULT_STORE),
+                        help="Shared store URL (sqlite:///path or redis://host:port/db)")
+    parser.add_argument('--cpu-workers', type=int, default=None,
+                        help="Preprocessing processes per worker (default: spare cores, if any)")
+    args = parser.parse_args(argv)
+
+    cpu_workers = args.cpu_workers
+    if cpu_workers is None:
+        cpu_workers = 1 if (os.cpu_count() or 1) > args.workers else 0
+
+    cluster = Cluster(
+        args.workers, args.port, host=args.host, store_url=args.store,
+        cpu_workers=cpu_workers, base_port=args.base_port,
+    )
+
+    def ready():
+        print(f"{args.workers} workers ready on http://{args.host}:{args.port} (store: {args.store})", flush=True)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(cluster.serve(on_ready=ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
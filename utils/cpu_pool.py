@@ -0,0 +1,37 @@
+"""Process pool for CPU-bound image work.
+
+Decoding, pre-triage and preprocess_image hold the GIL, so in a Streamlit
+worker they stall every other session's script thread. With
+AIDLY_CPU_WORKERS > 0, AnalysisPipeline runs them in this pool instead.
+Workers are spawned rather than forked, because forking the threaded
+Streamlit server is unsafe.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _warm_up():
+    # Import the image stack once per worker, not on the first real request
+    import utils.analysis_pipeline  # noqa: F401
+
+
+def get_cpu_pool():
+    """The shared pool, or None when AIDLY_CPU_WORKERS is unset or 0."""
+    global _pool
+    workers = int(os.environ.get('AIDLY_CPU_WORKERS', 0))
+    if workers <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up,
+                )
+    return _pool
@@ -0,0 +1,139 @@
+"""Deterministic local stand-ins for the model and location backends.
+
+Selected with ``AIDLY_BACKEND=fake`` (see utils.backends). Responses depend
+only on their inputs, so runs are reproducible, and latency and response
+sizes are configurable through environment variables so load tests can
+model a slow or fast upstream:
+
+    AIDLY_FAKE_ANALYSIS_MS     analyze_injury latency            (default 800)
+    AIDLY_FAKE_TTFT_MS         time to first streamed chunk      (default 300)
+    AIDLY_FAKE_CHUNK_MS        delay between streamed chunks     (default 20)
+    AIDLY_FAKE_RESPONSE_WORDS  words per first aid / chat answer (default 150)
+    AIDLY_FAKE_HOSPITALS       facilities per 5 km of radius     (default 25)
+    AIDLY_FAKE_LOCATION_MS     find_nearby_hospitals latency     (default 400)
+    AIDLY_FAKE_JITTER          +/- fraction applied to latencies (default 0.2)
+"""
+import hashlib
+import math
+import os
+import random
+import time
+
+CONDITIONS = [
+    ('Minor abrasion', 2), ('Superficial cut', 3), ('First-degree burn', 3),
+    ('Sprained ankle', 4), ('Deep laceration', 6), ('Second-degree burn', 6),
+    ('Suspected fracture', 7), ('Dog bite', 6), ('Severe bleeding wound', 9),
+    ('Third-degree burn', 9), ('Open fracture', 9),
+]
+
+WORDS = ("apply firm pressure clean cloth keep the person calm still raise limb "
+         "call 108 immediately cool running water twenty minutes cover loosely "
+         "do not remove embedded objects monitor breathing seek medical help").split()
+
+SPECIALTIES = ['Emergency', 'Trauma', 'Orthopedics', 'Burns', 'Cardiology', 'Pediatrics', 'General Surgery']
+
+
+def _setting(name, default):
+    return float(os.environ.get(f'AIDLY_FAKE_{name}', default))
+
+
+def _rng(*parts):
+    seed = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(seed, 'big'))
+
+
+def _sleep(ms, rng):
+    jitter = _setting('JITTER', 0.2)
+    time.sleep(max(0.0, ms * (1 + rng.uniform(-jitter, jitter))) / 1000)
+
+
+def _image_key(image):
+    if hasattr(image, 'tobytes'):
+        return hashlib.blake2b(image.tobytes(), digest_size=8).hexdigest()
+    return repr(image)
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(int(words)))
+
+
+def analyze_injury(image):
+    rng = _rng('analyze', _image_key(image))
+    _sleep(_setting('ANALYSIS_MS', 800), rng)
+    condition, severity = rng.choice(CONDITIONS)
+    return {
+        'condition': condition,
+        'severity_score': severity,
+        'description': _text(rng, 30),
+        'confidence': round(rng.uniform(0.6, 0.98), 2),
+    }
+
+
+def _first_aid_text(rng):
+    words = int(_setting('RESPONSE_WORDS', 150))
+    steps = max(1, words // 15)
+    return "\n".join(f"{i + 1}. {_text(rng, 15)}" for i in range(steps))
+
+
+def generate_first_aid(analysis_result):
+    rng = _rng('first_aid', analysis_result.get('condition'), analysis_result.get('severity_score'))
+    _sleep(_setting('TTFT_MS', 300) + _setting('CHUNK_MS', 20) * _setting('RESPONSE_WORDS', 150) / 5, rng)
+    return _first_aid_text(rng)
+
+
+def get_chatbot_response(prompt):
+    rng = _rng('chat', prompt)
+    _sleep(_setting('TTFT_MS', 300) + _setting('CHUNK_MS', 20) * _setting('RESPONSE_WORDS', 150) / 5, rng)
+    return _text(rng, _setting('RESPONSE_WORDS', 150))
+
+
+def _stream(text, rng):
+    # Real streaming APIs return a handful of words per chunk
+    _sleep(_setting('TTFT_MS', 300), rng)
+    words = text.split(' ')
+    for i in range(0, len(words), 5):
+        if i:
+            _sleep(_setting('CHUNK_MS', 20), rng)
+        yield ' '.join(words[i:i + 5]) + ' '
+
+
+def stream_first_aid(analysis_result):
+    rng = _rng('first_aid', analysis_result.get('condition'), analysis_result.get('severity_score'))
+    yield from _stream(_first_aid_text(rng), rng)
+
+
+def stream_chatbot_response(prompt, context=""):
+    rng = _rng('chat', prompt)
+    yield from _stream(_text(rng, _setting('RESPONSE_WORDS', 150)), rng)
+
+
+def summarize_conversation(summary, turns, max_tokens):
+    rng = _rng('summary', summary, len(turns))
+    _sleep(_setting('TTFT_MS', 300), rng)
+    return _text(rng, min(max_tokens, 60))
+
+
+def find_nearby_hospitals(radius_km=5, lat=28.610532, lng=77.101927):
+    rng = _rng('hospitals', round(lat, 3), round(lng, 3), radius_km)
+    _sleep(_setting('LOCATION_MS', 400), rng)
+    count = int(_setting('HOSPITALS', 25) * radius_km / 5)
+    hospitals = []
+    for i in range(count):
+        distance_km = radius_km * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 2 * math.pi)
+        h_lat = lat + distance_km / 111.32 * math.cos(bearing)
+        h_lng = lng + distance_km / (111.32 * math.cos(math.radians(lat))) * math.sin(bearing)
+        hospitals.append({
+            'name': f"Test Hospital {i + 1}",
+            'address': f"{rng.randint(1, 300)} Test Road, New Delhi",
+            'phone': f"+91 11 {rng.randint(20000000, 99999999)}",
+            'lat': h_lat,
+            'lng': h_lng,
+            'distance_km': distance_km,
+            'distance': f"{distance_km:.1f} km",
+            'specialties': rng.sample(SPECIALTIES, rng.randint(1, 3)),
+            'emergency': rng.random() < 0.5,
+            'directions_url': f"https://www.google.com/maps/dir/?api=1&destination={h_lat},{h_lng}",
+        })
+    hospitals.sort(key=lambda h: h['distance_km'])
+    return hospitals
@@ -0,0 +1,130 @@
+"""Streaming counterparts to the one-shot calls in utils.gemini_api.
+
+The model client is created lazily and shared by every session in the
+process. When the SDK or API key is unavailable the helpers fall back to the
+blocking functions and yield their result as a single chunk, so callers can
+always iterate. With ``AIDLY_BACKEND=fake`` the deterministic fake streams
+from utils.fake_backends are used instead.
+"""
+import json
+import os
+import threading
+
+from utils import backends
+from utils.backends import generate_first_aid, get_chatbot_response
+
+MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+
+FIRST_AID_PROMPT = """You are an emergency first aid assistant.
+An injury image was assessed as follows:
+
+{analysis}
+
+Give clear, numbered first aid steps for this condition that a bystander can
+follow right now. Mention when to call emergency services (112 / 108 in India).
+Use short markdown bullet points."""
+
+CHAT_PROMPT = """You are Aidly, an emergency first aid assistant for users in India.
+Answer the question below with practical, step-by-step first aid guidance.
+Be concise, and always advise calling 112 or 108 when the situation could be
+life-threatening. You do not replace professional medical care.
+
+{context}
+
+Question: {question}"""
+
+SUMMARY_PROMPT = """Update the running summary of an emergency first aid conversation.
+Keep injuries, symptoms, actions already taken and advice already given.
+Stay under {max_words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}"""
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Return the shared GenerativeModel, or None if it cannot be created."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    return None
+                try:
+                    import google.generativeai as genai
+                except ImportError:
+                    return None
+                genai.configure(api_key=api_key)
+                _model = genai.GenerativeModel(MODEL_NAME)
+    return _model
+
+
+def _request_options():
+    # Cut the request off at the scheduler deadline rather than the SDK default
+    from utils.scheduler import remaining_time
+    timeout = remaining_time()
+    return {'timeout': timeout} if timeout is not None else {}
+
+
+def _stream_text(prompt):
+    response = get_model().generate_content(prompt, stream=True, request_options=_request_options())
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety metadata) raise on .text
+            continue
+        if text:
+            yield text
+
+
+def stream_first_aid(analysis_result):
+    """Yield first aid instructions for ``analysis_result`` as they are generated."""
+    if backends.FAKE:
+        from utils.fake_backends import stream_first_aid as fake_stream
+        yield from fake_stream(analysis_result)
+        return
+    if get_model() is None:
+        yield generate_first_aid(analysis_result)
+        return
+    analysis = json.dumps(analysis_result, indent=2, default=str)
+    yield from _stream_text(FIRST_AID_PROMPT.format(analysis=analysis))
+
+
+def stream_chatbot_response(prompt, context=""):
+    """Yield the chat answer to ``prompt`` chunk by chunk as the model produces it.
+
+    ``context`` is the rendered conversation context (see utils.chat_context).
+    """
+    if backends.FAKE:
+        from utils.fake_backends import stream_chatbot_response as fake_stream
+        yield from fake_stream(prompt, context)
+        return
+    if get_model() is None:
+        yield get_chatbot_response(f"{context}\n\nQuestion: {prompt}" if context else prompt)
+        return
+    yield from _stream_text(CHAT_PROMPT.format(context=context, question=prompt))
+
+
+def summarize_conversation(summary, turns, max_tokens):
+    """Fold ``turns`` into ``summary`` with the model; used by ConversationContext."""
+    from utils.chat_context import extractive_summary
+
+    if backends.FAKE:
+        from utils.fake_backends import summarize_conversation as fake_summary
+        return fake_summary(summary, turns, max_tokens)
+    if get_model() is None:
+        return extractive_summary(summary, turns, max_tokens)
+    rendered = "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in turns)
+    prompt = SUMMARY_PROMPT.format(
+        max_words=max_tokens * 3 // 4,
+        summary=summary or "(empty)",
+        turns=rendered,
+    )
+    return get_model().generate_content(prompt, request_options=_request_options()).text.strip()
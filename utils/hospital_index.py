@@ -0,0 +1,282 @@
+"""Grid-bucket spatial index over the hospital dataset.
+
+Facilities are bucketed into fixed-size lat/lng cells when the index is
+built. A radius query only looks at the cells that overlap the search
+circle, and a k-nearest query grows outwards ring by ring, so lookup cost
+depends on local facility density rather than on the size of the dataset.
+
+Coordinates live in contiguous NumPy arrays sorted by cell key, so one
+row of cells is a single searchsorted range, and distance, radius filtering
+and ranking for all candidates run in one vectorized pass. The hospital
+store is written in this order with the cell keys and the specialty matrix
+precomputed, so an index over a store maps its columns without copying or
+decoding anything. Numeric distances (``distance_km``) are kept separate
+from the formatted ``distance`` string used for display.
+"""
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+DEFAULT_CELL_DEG = 0.05
+# Cell (row, col) has key row * CELL_KEY_STRIDE + col, so sorting by key
+# sorts by row and then column
+CELL_KEY_STRIDE = 1 << 32
+
+DEFAULT_DATASET_PATH = os.environ.get(
+    'AIDLY_HOSPITALS_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'hospitals.json'),
+)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _parse_specialties(value):
+    if isinstance(value, str):
+        return [s.strip() for s in value.replace(';', ',').split(',') if s.strip()]
+    return list(value or [])
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def load_hospital_records(path=DEFAULT_DATASET_PATH):
+    """Load hospital records from a JSON list or a CSV file.
+
+    Each record needs ``name``, ``lat`` and ``lng``; ``address``, ``phone``,
+    ``specialties`` and ``emergency`` are optional.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+
+    records = []
+    for row in rows:
+        try:
+            lat = float(row['lat'])
+            lng = float(row['lng'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        records.append({
+            'name': row.get('name') or 'Unnamed facility',
+            'address': row.get('address') or '',
+            'phone': row.get('phone') or 'N/A',
+            'lat': lat,
+            'lng': lng,
+            'specialties': _parse_specialties(row.get('specialties')),
+            'emergency': _parse_bool(row.get('emergency', False)),
+        })
+    return records
+
+
+def _column(records, name):
+    """A column from a HospitalStore, or gathered from a list of record dicts."""
+    if hasattr(records, 'column'):
+        return records.column(name)
+    if name == 'emergency':
+        return [bool(r.get('emergency')) for r in records]
+    if name == 'specialties':
+        return [r.get('specialties', []) for r in records]
+    return [r[name] for r in records]
+
+
+def cell_keys(lats, lngs, cell_deg=DEFAULT_CELL_DEG):
+    """Grid cell key of each coordinate."""
+    rows = np.floor(np.asarray(lats, dtype=np.float64) / cell_deg).astype(np.int64)
+    cols = np.floor(np.asarray(lngs, dtype=np.float64) / cell_deg).astype(np.int64)
+    return rows * CELL_KEY_STRIDE + cols
+
+
+def specialty_matrix(specialties):
+    """Lowercased specialty names and the boolean facility x specialty matrix."""
+    ids = {}
+    for values in specialties:
+        for specialty in values:
+            ids.setdefault(specialty.lower(), len(ids))
+    matrix = np.zeros((len(specialties), len(ids)), dtype=bool)
+    for i, values in enumerate(specialties):
+        for specialty in values:
+            matrix[i, ids[specialty.lower()]] = True
+    return list(ids), matrix
+
+
+class HospitalIndex:
+    def __init__(self, records, cell_deg=DEFAULT_CELL_DEG):
+        """Build the index over a list of record dicts or a HospitalStore.
+
+        Records are only materialized as dicts when they are returned from a
+        query, so a memory-mapped store is never copied wholesale.
+        """
+        self.cell_deg = cell_deg
+        self._source = records
+
+        layout = getattr(records, 'index_layout', None)
+        if layout is not None and layout['cell_deg'] == cell_deg:
+            # The store is already sorted by cell: use its mapped columns
+            self._order = None
+            self.lat = records.lat
+            self.lng = records.lng
+            self.emergency = records.emergency
+            self._keys = layout['cell_keys']
+            names = layout['specialty_names']
+            self._specialties = layout['specialties']
+        else:
+            # Sort facilities by grid cell so every cell is one contiguous slice
+            lats = np.asarray(_column(records, 'lat'), dtype=np.float64)
+            lngs = np.asarray(_column(records, 'lng'), dtype=np.float64)
+            keys = cell_keys(lats, lngs, cell_deg)
+            order = np.argsort(keys, kind='stable')
+            self._order = order
+            self.lat = np.ascontiguousarray(lats[order])
+            self.lng = np.ascontiguousarray(lngs[order])
+            self.emergency = np.asarray(_column(records, 'emergency'), dtype=bool)[order]
+            self._keys = keys[order]
+            # Boolean facility x specialty matrix for vectorized specialty matching
+            names, matrix = specialty_matrix(_column(records, 'specialties'))
+            self._specialties = matrix[order]
+
+        self._specialty_ids = {name: i for i, name in enumerate(names)}
+        self._lat_rad = np.radians(self.lat)
+        self._lng_rad = np.radians(self.lng)
+        self._cos_lat = np.cos(self._lat_rad)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_DATASET_PATH, **kwargs):
+        return cls(load_hospital_records(path), **kwargs)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def record(self, i):
+        """The record at sorted position ``i``."""
+        if self._order is None:
+            return self._source[int(i)]
+        return self._source[int(self._order[i])]
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _candidate_indices(self, lat, lng, radius_km):
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlng = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+        row_lo, col_lo = self._cell(lat - dlat, lng - dlng)
+        row_hi, col_hi = self._cell(lat + dlat, lng + dlng)
+        # The overlapping cells of one row are a single key range
+        rows = np.arange(row_lo, row_hi + 1, dtype=np.int64) * CELL_KEY_STRIDE
+        starts = np.searchsorted(self._keys, rows + col_lo, side='left')
+        ends = np.searchsorted(self._keys, rows + col_hi, side='right')
+        slices = [np.arange(start, end) for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def distances_km(self, lat, lng, indices=None):
+        """Haversine distance from the point to each facility (or ``indices``)."""
+        if indices is None:
+            indices = slice(None)
+        phi = math.radians(lat)
+        dphi = self._lat_rad[indices] - phi
+        dlmb = self._lng_rad[indices] - math.radians(lng)
+        a = np.sin(dphi / 2) ** 2 + math.cos(phi) * self._cos_lat[indices] * np.sin(dlmb / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+    def _specialty_columns(self, specialties):
+        return [self._specialty_ids[s.lower()] for s in specialties or [] if s.lower() in self._specialty_ids]
+
+    def _specialty_matches(self, indices, specialties):
+        columns = self._specialty_columns(specialties)
+        if not columns:
+            return np.zeros(len(indices), dtype=np.int64)
+        return self._specialties[np.ix_(indices, columns)].sum(axis=1)
+
+    def _query(self, lat, lng, radius_km, limit, emergency_first, specialties):
+        indices = self._candidate_indices(lat, lng, radius_km)
+        distances = self.distances_km(lat, lng, indices)
+        inside = distances <= radius_km
+        indices = indices[inside]
+        distances = distances[inside]
+
+        if emergency_first or specialties:
+            # lexsort uses the last key as primary: specialty matches, then
+            # emergency availability, then distance
+            keys = [distances]
+            if emergency_first:
+                keys.append(~self.emergency[indices])
+            if specialties:
+                keys.append(-self._specialty_matches(indices, specialties))
+            order = np.lexsort(keys)
+            if limit is not None:
+                order = order[:limit]
+        elif limit is not None and limit < len(distances):
+            top = np.argpartition(distances, limit)[:limit]
+            order = top[np.argsort(distances[top], kind='stable')]
+        else:
+            order = np.argsort(distances, kind='stable')
+        return indices[order], distances[order]
+
+    def within(self, lat, lng, radius_km, limit=None, emergency_first=False, specialties=None):
+        """Facilities within ``radius_km`` of the point, nearest first.
+
+        ``emergency_first`` ranks facilities with emergency services ahead of
+        the rest, and ``specialties`` ranks by how many of the given
+        specialties a facility offers; distance breaks ties.
+        """
+        indices, distances = self._query(lat, lng, radius_km, limit, emergency_first, specialties)
+        return self._results(indices, distances, lat, lng)
+
+    def _top_ranked(self, i, emergency_first, specialties):
+        """True if no facility further away can rank ahead of facility ``i``."""
+        if emergency_first and not self.emergency[i]:
+            return False
+        if specialties:
+            return self._specialty_matches(np.array([i]), specialties)[0] == len(self._specialty_columns(specialties))
+        return True
+
+    def nearest(self, lat, lng, k=5, max_radius_km=200.0, emergency_first=False, specialties=None):
+        """The ``k`` best facilities, searching no further than ``max_radius_km``."""
+        radius_km = self.cell_deg * KM_PER_DEGREE_LAT
+        while True:
+            indices, distances = self._query(lat, lng, radius_km, None, emergency_first, specialties)
+            # Grow until k fit and the k-th is top-ranked: only then can no
+            # facility outside the searched circle outrank one inside it
+            if radius_km >= max_radius_km or (
+                    len(indices) >= k and self._top_ranked(indices[k - 1], emergency_first, specialties)):
+                return self._results(indices[:k], distances[:k], lat, lng)
+            radius_km = min(radius_km * 2, max_radius_km)
+
+    def _results(self, indices, distances, user_lat, user_lng):
+        return [
+            self._result(i, d, user_lat, user_lng)
+            for i, d in zip(indices.tolist(), distances.tolist())
+        ]
+
+    def _result(self, i, distance_km, user_lat, user_lng):
+        hospital = dict(self.record(i))
+        hospital['distance_km'] = distance_km
+        hospital['distance'] = f"{distance_km:.1f} km"
+        hospital['directions_url'] = (
+            "https://www.google.com/maps/dir/?api=1"
+            f"&origin={user_lat},{user_lng}"
+            f"&destination={hospital['lat']},{hospital['lng']}"
+            "&travelmode=driving"
+        )
+        return hospital
@@ -0,0 +1,363 @@
+"""Offline-first, memory-mapped hospital store.
+
+Facilities are stored column by column so a worker can open the whole
+dataset with ``np.load(mmap_mode='r')`` and never parse or copy it:
+
+    <store>/CURRENT                 name of the active version directory
+    <store>/v<timestamp>/meta.json  row count, refresh cursor, last check, source
+    <store>/v<timestamp>/lat.npy, lng.npy          float64
+    <store>/v<timestamp>/emergency.npy             bool
+    <store>/v<timestamp>/osm_id.npy                int64 (0 if unknown)
+    <store>/v<timestamp>/<field>.bin + .idx.npy    UTF-8 blob + offsets
+                                                   (name, address, phone,
+                                                   specialties)
+    <store>/v<timestamp>/cell.npy                  int64 grid cell key
+    <store>/v<timestamp>/specialty_matrix.npy      bool, facility x specialty
+                                                   (names in meta.json)
+
+Rows are written sorted by grid cell key (utils.hospital_index), so
+HospitalIndex can use the mapped columns directly instead of sorting and
+decoding them on every load.
+
+Writers build a new version directory and then atomically replace CURRENT,
+so readers always see a complete snapshot. A background HospitalStoreRefresher
+pulls changes from OpenStreetMap (Overpass ``newer:`` queries) and merges
+them in; the app only runs one when AIDLY_HOSPITAL_REFRESH_HOURS is set.
+Request-time lookups only read the local files. Build the first version
+with one of:
+
+    python -m utils.hospital_store import data/hospitals.json
+    python -m utils.hospital_store refresh [--full]
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.hospital_index import DEFAULT_CELL_DEG, cell_keys, specialty_matrix
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.environ.get(
+    'AIDLY_HOSPITAL_STORE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'hospital_store'),
+)
+# south, west, north, east; defaults to India
+DEFAULT_BBOX = tuple(float(v) for v in os.environ.get('AIDLY_HOSPITALS_BBOX', '6.5,68.1,35.7,97.4').split(','))
+OVERPASS_URL = os.environ.get('AIDLY_OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+
+TEXT_FIELDS = ('name', 'address', 'phone', 'specialties')
+OSM_TYPE_CODES = {'node': 1, 'way': 2, 'relation': 3}
+
+
+def current_version(path=DEFAULT_STORE_PATH):
+    """Name of the active store version, or None if no store exists."""
+    try:
+        with open(os.path.join(path, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class HospitalStore:
+    """Read-only view over one version of the store."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH, version=None):
+        version = version or current_version(path)
+        if version is None:
+            raise FileNotFoundError(f"No hospital store at {path}")
+        self.path = path
+        self.version = version
+        directory = os.path.join(path, version)
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode='r')
+
+        self.lat = load('lat.npy')
+        self.lng = load('lng.npy')
+        self.emergency = load('emergency.npy')
+        self.osm_id = load('osm_id.npy')
+        self._text = {}
+        for field in TEXT_FIELDS:
+            blob_path = os.path.join(directory, f'{field}.bin')
+            blob = (np.memmap(blob_path, dtype=np.uint8, mode='r')
+                    if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8))
+            self._text[field] = (blob, load(f'{field}.idx.npy'))
+
+        # Versions written before the index layout was stored have none
+        self.index_layout = None
+        if 'cell_deg' in self.meta and os.path.exists(os.path.join(directory, 'cell.npy')):
+            self.index_layout = {
+                'cell_deg': self.meta['cell_deg'],
+                'cell_keys': load('cell.npy'),
+                'specialty_names': self.meta['specialty_names'],
+                'specialties': load('specialty_matrix.npy'),
+            }
+
+    def __len__(self):
+        return len(self.lat)
+
+    def text(self, field, i):
+        blob, offsets = self._text[field]
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def specialties(self, i):
+        value = self.text('specialties', i)
+        return value.split(';') if value else []
+
+    def _text_column(self, field):
+        blob, offsets = self._text[field]
+        raw = blob.tobytes()
+        bounds = offsets.tolist()
+        return [raw[a:b].decode('utf-8') for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def column(self, name):
+        """Whole column: arrays for numeric fields, lists for text fields."""
+        if name in ('lat', 'lng', 'emergency', 'osm_id'):
+            return getattr(self, name)
+        if name == 'specialties':
+            return [value.split(';') if value else [] for value in self._text_column('specialties')]
+        return self._text_column(name)
+
+    def __getitem__(self, i):
+        return {
+            'name': self.text('name', i),
+            'address': self.text('address', i),
+            'phone': self.text('phone', i) or 'N/A',
+            'lat': float(self.lat[i]),
+            'lng': float(self.lng[i]),
+            'specialties': self.specialties(i),
+            'emergency': bool(self.emergency[i]),
+            'osm_id': int(self.osm_id[i]),
+        }
+
+    def records(self):
+        return [self[i] for i in range(len(self))]
+
+
+def _write_text_column(directory, field, values):
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f'{field}.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(directory, f'{field}.idx.npy'), offsets)
+
+
+def write_store(records, path=DEFAULT_STORE_PATH, meta=None, keep_versions=2, cell_deg=DEFAULT_CELL_DEG):
+    """Write ``records`` as a new store version and make it current."""
+    os.makedirs(path, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    directory = os.path.join(path, version)
+    os.makedirs(directory)
+
+    # Write in spatial index order, with the index's derived columns
+    keys = cell_keys([r['lat'] for r in records], [r['lng'] for r in records], cell_deg)
+    order = np.argsort(keys, kind='stable')
+    records = [records[i] for i in order.tolist()]
+    specialty_names, specialties = specialty_matrix([r.get('specialties') or [] for r in records])
+    np.save(os.path.join(directory, 'cell.npy'), keys[order])
+    np.save(os.path.join(directory, 'specialty_matrix.npy'), specialties)
+
+    np.save(os.path.join(directory, 'lat.npy'), np.array([r['lat'] for r in records], dtype=np.float64))
+    np.save(os.path.join(directory, 'lng.npy'), np.array([r['lng'] for r in records], dtype=np.float64))
+    np.save(os.path.join(directory, 'emergency.npy'), np.array([bool(r.get('emergency')) for r in records], dtype=bool))
+    np.save(os.path.join(directory, 'osm_id.npy'), np.array([int(r.get('osm_id') or 0) for r in records], dtype=np.int64))
+    _write_text_column(directory, 'name', [r.get('name') or '' for r in records])
+    _write_text_column(directory, 'address', [r.get('address') or '' for r in records])
+    _write_text_column(directory, 'phone', [r.get('phone') if r.get('phone') not in (None, 'N/A') else '' for r in records])
+    _write_text_column(directory, 'specialties', [';'.join(r.get('specialties') or []) for r in records])
+
+    meta = dict(meta or {})
+    meta['count'] = len(records)
+    meta['cell_deg'] = cell_deg
+    meta['specialty_names'] = specialty_names
+    meta['written_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    # Atomically switch readers to the new version
+    tmp_current = os.path.join(path, 'CURRENT.tmp')
+    with open(tmp_current, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(path, 'CURRENT'))
+
+    # Old versions may still be mapped by other workers; keep a few around
+    versions = sorted(d for d in os.listdir(path) if d.startswith('v') and d != version)
+    for old in versions[:max(0, len(versions) - (keep_versions - 1))]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+    return version
+
+
+def _osm_address(tags):
+    if tags.get('addr:full'):
+        return tags['addr:full']
+    parts = [tags.get(k) for k in ('addr:housenumber', 'addr:street', 'addr:suburb', 'addr:city', 'addr:postcode')]
+    return ', '.join(p for p in parts if p)
+
+
+def _osm_record(element):
+    tags = element.get('tags', {})
+    center = element.get('center', element)
+    if 'lat' not in center or 'lon' not in center:
+        return None
+    specialties = tags.get('healthcare:speciality', '')
+    return {
+        'osm_id': element['id'] * 4 + OSM_TYPE_CODES.get(element['type'], 0),
+        'name': tags.get('name') or tags.get('name:en') or 'Unnamed facility',
+        'address': _osm_address(tags),
+        'phone': tags.get('phone') or tags.get('contact:phone') or '',
+        'lat': float(center['lat']),
+        'lng': float(center['lon']),
+        'specialties': [s.strip().replace('_', ' ').title() for s in specialties.split(';') if s.strip()],
+        'emergency': tags.get('emergency') == 'yes',
+    }
+
+
+def fetch_overpass(bbox=DEFAULT_BBOX, since=None, timeout=300):
+    """Hospitals from OpenStreetMap, optionally only those changed after ``since``."""
+    import requests
+
+    newer = f'(newer:"{since}")' if since else ''
+    south, west, north, east = bbox
+    query = f"""
+    [out:json][timeout:{timeout}];
+    nwr["amenity"="hospital"]{newer}({south},{west},{north},{east});
+    out center tags;
+    """
+    response = requests.post(OVERPASS_URL, data={'data': query}, timeout=timeout + 30)
+    response.raise_for_status()
+    records = []
+    for element in response.json().get('elements', []):
+        record = _osm_record(element)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def _update_meta(store, **updates):
+    """Rewrite a version's meta.json in place; the data files are untouched."""
+    meta = dict(store.meta, **updates)
+    directory = os.path.join(store.path, store.version)
+    tmp_path = os.path.join(directory, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+
+def refresh_store(path=DEFAULT_STORE_PATH, bbox=DEFAULT_BBOX, full=False, fetch=fetch_overpass):
+    """Merge upstream changes into the store; returns the number of changed rows.
+
+    Incremental refreshes only download facilities edited since the last
+    refresh and merge them by OSM id. A full refresh also drops OSM
+    facilities that disappeared upstream; facilities without an OSM id
+    (imported from a local dataset) are always kept.
+    """
+    started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    existing = HospitalStore(path) if current_version(path) is not None else None
+
+    since = existing.meta.get('cursor') if existing is not None and not full else None
+    changed = fetch(bbox=bbox, since=since)
+    if not changed:
+        # An empty full refresh is treated as an upstream problem, not as
+        # every facility having closed. With no store yet, nothing is
+        # written, so the app keeps using the live search instead of an
+        # empty index.
+        if existing is not None:
+            # Record the check so the refresher waits a full interval again
+            _update_meta(existing, checked_at=started, cursor=existing.meta.get('cursor') if full else started)
+        return 0
+
+    merged = {}
+    if existing is not None:
+        for record in existing.records():
+            if record['osm_id']:
+                if not full:
+                    merged[record['osm_id']] = record
+            else:
+                merged[f"local:{record['name']}:{record['lat']}:{record['lng']}"] = record
+    for record in changed:
+        merged[record['osm_id']] = record
+
+    full_at = started if full or existing is None else existing.meta.get('full_at')
+    meta = {'cursor': started, 'checked_at': started, 'full_at': full_at, 'source': 'overpass', 'bbox': list(bbox)}
+    write_store(list(merged.values()), path, meta=meta)
+    return len(changed)
+
+
+def _timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+
+
+class HospitalStoreRefresher(threading.Thread):
+    """Daemon thread that refreshes the store every ``interval_hours``."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH, interval_hours=24, full_every_days=7, bbox=DEFAULT_BBOX):
+        super().__init__(name='hospital-store-refresher', daemon=True)
+        self.path = path
+        self.interval = interval_hours * 3600
+        self.full_every = full_every_days * 86400
+        self.bbox = bbox
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _due(self):
+        """Return ``(due, full)`` for the current store version."""
+        if current_version(self.path) is None:
+            return True, True
+        store = HospitalStore(self.path)
+        checked_at = store.meta.get('checked_at')
+        if checked_at is not None:
+            checked = _timestamp(checked_at)
+        else:
+            # Imported stores have not been checked against upstream yet
+            checked = os.path.getmtime(os.path.join(self.path, store.version, 'meta.json'))
+        full_at = store.meta.get('full_at')
+        full = full_at is None or time.time() - _timestamp(full_at) >= self.full_every
+        return time.time() - checked >= self.interval, full
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                due, full = self._due()
+                if due:
+                    changed = refresh_store(self.path, self.bbox, full=full)
+                    logger.info("Hospital store refreshed: %d changed facilities", changed)
+            except Exception:
+                # Upstream failures only delay freshness; the old snapshot keeps serving
+                logger.exception("Hospital store refresh failed")
+            self._stop_event.wait(min(self.interval, 3600))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the offline hospital store")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_cmd = sub.add_parser('import', help="Build the store from a JSON or CSV dataset")
+    import_cmd.add_argument('dataset')
+    refresh_cmd = sub.add_parser('refresh', help="Pull changes from OpenStreetMap")
+    refresh_cmd.add_argument('--full', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        from utils.hospital_index import load_hospital_records
+        records = load_hospital_records(args.dataset)
+        version = write_store(records, args.store, meta={'source': os.path.abspath(args.dataset)})
+        print(f"Wrote {len(records)} facilities to {args.store} ({version})")
+    else:
+        changed = refresh_store(args.store, full=args.full)
+        print(f"{changed} facilities changed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Bounded-memory ingestion for uploaded and camera images.
+
+Uploads are never copied just to measure them, and JPEGs are decoded at a
+reduced scale with PIL's draft mode so a 50 MP phone photo never exists as a
+full-resolution bitmap. What ends up in session state is a compact JPEG
+buffer at the resolution the analysis needs, not a PIL image.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_MB = 200
+INGEST_MAX_SIDE = int(os.environ.get('AIDLY_INGEST_MAX_SIDE', 1024))
+INGEST_QUALITY = 85
+
+# Refuse images whose header claims an absurd pixel count before decoding
+MAX_SOURCE_PIXELS = 100_000_000
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload exceeds the size or pixel limits."""
+
+
+def file_size(file):
+    """Size of an uploaded file in bytes, without reading its contents."""
+    size = getattr(file, 'size', None)
+    if size is not None:
+        return size
+    position = file.tell()
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def ingest_image(file, max_side=INGEST_MAX_SIDE, quality=INGEST_QUALITY):
+    """Decode ``file`` straight to at most ``max_side`` pixels and return JPEG bytes."""
+    if file_size(file) > MAX_UPLOAD_MB * 1024 * 1024:
+        raise ImageTooLarge(f"File size exceeds {MAX_UPLOAD_MB}MB limit")
+
+    file.seek(0)
+    image = Image.open(file)
+    width, height = image.size
+    if width * height > MAX_SOURCE_PIXELS:
+        raise ImageTooLarge(f"Image is too large ({width}x{height} pixels)")
+
+    # For JPEGs this makes the decoder scale down by 1/2, 1/4 or 1/8 while
+    # decoding; other formats ignore it and are reduced by thumbnail()
+    image.draft('RGB', (max_side, max_side))
+    image.thumbnail((max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def load_image(buffer):
+    """Decode a buffer produced by ingest_image back into an RGB PIL image."""
+    image = Image.open(io.BytesIO(buffer))
+    image.load()
+    return image
@@ -0,0 +1,174 @@
+"""Hospital map rendering for the Find Hospitals tab.
+
+The map is rendered to a standalone HTML string once per (location cell,
+radius, result set) and reused on every rerun, by every user in that cell.
+The cached layer is centred on the cell and contains nothing specific to
+one user: directions links carry only the destination, and each user's own
+marker is added afterwards by add_user_location. Popups come from a single
+shared template. Past CLUSTER_THRESHOLD results, markers go through
+FastMarkerCluster. It ships the coordinates as one compact JSON array and
+builds each marker and popup in the browser, so payload size grows by a few
+dozen bytes per facility instead of a full Marker + Popup block.
+"""
+import hashlib
+import html
+import json
+
+CLUSTER_THRESHOLD = 50
+LOCATION_CELL_DEG = 0.001  # ~110 m
+
+POPUP_TEMPLATE = """<div style="width: 250px; padding: 10px;">
+    <h4 style="color: #FF4B4B; margin: 0 0 10px 0;">{name}</h4>
+    <p style="margin: 5px 0;"><b>Distance:</b> {distance}</p>
+    <p style="margin: 5px 0;"><b>Phone:</b> {phone}</p>
+    <p style="margin: 5px 0;"><b>Address:</b> {address}</p>
+    <div style="margin-top: 10px;">
+        <a href="{directions_url}" target="_blank" style="color: #FF4B4B;">Get Directions</a>
+    </div>
+</div>"""
+
+HOSPITAL_CARD_TEMPLATE = """<div style="background-color: #f0f2f6; padding: 15px; border-radius: 10px; margin: 10px 0;">
+    <h4 style="color: #FF4B4B; margin: 0 0 10px 0;">{name}</h4>
+    <p style="margin: 5px 0;"><b>📍 Distance:</b> {distance}</p>
+    <p style="margin: 5px 0;"><b>📞 Phone:</b> {phone}</p>
+    <p style="margin: 5px 0;"><b>🏥 Address:</b> {address}</p>
+    <p style="margin: 5px 0;"><b>⚕️ Specialties:</b> {specialties}</p>
+    {emergency}
+    <div style="margin-top: 10px;">
+        <a href="{directions_url}" target="_blank" style="background-color: #FF4B4B; color: white; padding: 8px 16px; text-decoration: none; border-radius: 4px;">Get Directions</a>
+    </div>
+</div>"""
+
+# JS version of POPUP_TEMPLATE for FastMarkerCluster; row is
+# [lat, lng, name, distance, phone, address, directions_url]
+FAST_MARKER_CALLBACK = """
+function (row) {
+    var esc = function (s) {
+        return String(s).replace(/[&<>"']/g, function (c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    };
+    var icon = L.AwesomeMarkers.icon({icon: 'plus', prefix: 'fa', markerColor: 'red'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip(esc(row[2]));
+    marker.bindPopup(
+        '<div style="width: 250px; padding: 10px;">' +
+        '<h4 style="color: #FF4B4B; margin: 0 0 10px 0;">' + esc(row[2]) + '</h4>' +
+        '<p style="margin: 5px 0;"><b>Distance:</b> ' + esc(row[3]) + '</p>' +
+        '<p style="margin: 5px 0;"><b>Phone:</b> ' + esc(row[4]) + '</p>' +
+        '<p style="margin: 5px 0;"><b>Address:</b> ' + esc(row[5]) + '</p>' +
+        '<div style="margin-top: 10px;"><a href="' + esc(row[6]) + '" target="_blank" style="color: #FF4B4B;">Get Directions</a></div>' +
+        '</div>', {maxWidth: 300});
+    return marker;
+}
+"""
+
+USER_LOCATION_SCRIPT = """<script>
+(function () {{
+    var icon = L.AwesomeMarkers.icon({{icon: 'info-sign', prefix: 'glyphicon', markerColor: 'blue', iconColor: 'white'}});
+    L.marker([{lat}, {lng}], {{icon: icon}}).bindPopup("Your Location").addTo({map_name});
+}})();
+</script>
+"""
+
+
+def directions_url(hospital):
+    """Directions to ``hospital`` from wherever the viewer is."""
+    if 'lat' not in hospital or 'lng' not in hospital:
+        return '#'
+    return (
+        "https://www.google.com/maps/dir/?api=1"
+        f"&destination={hospital['lat']},{hospital['lng']}"
+        "&travelmode=driving"
+    )
+
+
+def _fields(hospital, directions=None):
+    return {
+        'name': html.escape(str(hospital['name'])),
+        'distance': html.escape(str(hospital['distance'])),
+        'phone': html.escape(str(hospital.get('phone', 'N/A'))),
+        'address': html.escape(str(hospital.get('address', ''))),
+        'directions_url': html.escape(str(directions or hospital.get('directions_url', '#'))),
+    }
+
+
+def render_hospital_card(hospital):
+    """HTML card for the list column beside the map."""
+    emergency = ("<p style='margin: 5px 0;'><b>🚨 Emergency Services:</b> Available</p>"
+                 if hospital.get('emergency', False) else "")
+    return HOSPITAL_CARD_TEMPLATE.format(
+        specialties=html.escape(', '.join(hospital.get('specialties', []))),
+        emergency=emergency,
+        **_fields(hospital),
+    )
+
+
+def location_cell(lat, lng):
+    """Grid cell used to share rendered maps between nearby users."""
+    return (round(lat / LOCATION_CELL_DEG), round(lng / LOCATION_CELL_DEG))
+
+
+def cell_center(cell):
+    """Centre ``(lat, lng)`` of a location_cell."""
+    return (cell[0] * LOCATION_CELL_DEG, cell[1] * LOCATION_CELL_DEG)
+
+
+def results_digest(hospitals):
+    """Stable hash of a result set, for cache keys."""
+    h = hashlib.blake2b(digest_size=16)
+    for hospital in hospitals:
+        h.update(f"{hospital['name']}|{hospital['lat']:.6f}|{hospital['lng']:.6f}|{hospital['distance']}\n".encode())
+    return h.hexdigest()
+
+
+def build_map_html(center_lat, center_lng, hospitals):
+    """Render the shared hospital map to a standalone HTML document.
+
+    Returns ``(html, map_name)``; pass both to add_user_location to place
+    the viewer's own marker.
+    """
+    import folium
+    from folium import plugins
+
+    # Centre on the location cell, not on any one user's position
+    m = folium.Map(location=[center_lat, center_lng], zoom_start=13, tiles="OpenStreetMap")
+
+    if len(hospitals) > CLUSTER_THRESHOLD:
+        rows = [
+            [h['lat'], h['lng'], h['name'], h['distance'], h.get('phone', 'N/A'),
+             h.get('address', ''), directions_url(h)]
+            for h in hospitals
+        ]
+        plugins.FastMarkerCluster(rows, callback=FAST_MARKER_CALLBACK, name="Hospitals").add_to(m)
+    else:
+        hospital_group = folium.FeatureGroup(name="Hospitals")
+        for hospital in hospitals:
+            folium.Marker(
+                location=[hospital['lat'], hospital['lng']],
+                popup=folium.Popup(POPUP_TEMPLATE.format(**_fields(hospital, directions_url(hospital))), max_width=300),
+                icon=folium.Icon(color="red", icon="plus", prefix='fa'),
+                tooltip=html.escape(str(hospital['name'])),
+            ).add_to(hospital_group)
+        hospital_group.add_to(m)
+
+    folium.LayerControl().add_to(m)
+    plugins.Fullscreen().add_to(m)
+
+    # Fit bounds to include all markers and the cell the users are in
+    bounds = [[h['lat'], h['lng']] for h in hospitals]
+    bounds.append([center_lat, center_lng])
+    m.fit_bounds(bounds)
+
+    return m.get_root().render(), m.get_name()
+
+
+def add_user_location(map_html, map_name, user_lat, user_lng):
+    """Add the viewer's "Your Location" marker to a map from build_map_html."""
+    script = USER_LOCATION_SCRIPT.format(
+        map_name=map_name, lat=json.dumps(float(user_lat)), lng=json.dumps(float(user_lng)),
+    )
+    end = map_html.rfind('</html>')
+    if end == -1:
+        return map_html + script
+    return map_html[:end] + script + map_html[end:]
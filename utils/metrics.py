@@ -0,0 +1,267 @@
+"""Hot-path instrumentation and metrics export.
+
+Stages record their wall time into a process-wide registry with
+
+    with metrics.span('analyze_injury'):
+        ...
+
+Counters, gauges and latency histograms are exported in Prometheus text
+format or as JSON. Cache hit rates and scheduler state are pulled from
+registered collectors at export time. start_metrics_server serves:
+
+    /metrics        Prometheus exposition format
+    /metrics.json   the same data as JSON
+    /profile        collapsed stacks from the sampling profiler, if enabled
+
+The optional SamplingProfiler snapshots every thread's stack at a fixed
+interval. Its output can be fed straight to flamegraph.pl or speedscope.
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers cache hits (sub-ms) through slow model calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes; per-session state from an empty session to several large images
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 5e7)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = Counter()
+        self._gauges = {}
+        self._collectors = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def register_collector(self, name, collect):
+        """``collect()`` returns ``{metric_name: value}`` gauges at export time."""
+        with self._lock:
+            self._collectors[name] = collect
+
+    @contextmanager
+    def span(self, stage):
+        """Record the wall time of the block as ``aidly_stage_seconds{stage=...}``."""
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self.observe('aidly_stage_seconds', time.perf_counter() - start, stage=stage)
+            self.increment('aidly_stage_total', stage=stage, status=status)
+
+    def _collected(self):
+        with self._lock:
+            collectors = dict(self._collectors)
+        gauges = {}
+        for source, collect in collectors.items():
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for name, value in values.items():
+                gauges[(name, (('source', source),))] = value
+        return gauges
+
+    def snapshot(self):
+        """All metrics as plain JSON-serializable data."""
+        collected = self._collected()
+        with self._lock:
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': h.count,
+                    'sum': h.total,
+                    'p50': h.quantile(0.5),
+                    'p95': h.quantile(0.95),
+                    'p99': h.quantile(0.99),
+                }
+                for (name, labels), h in self._histograms.items()
+            ]
+            counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in self._counters.items()]
+            gauges = dict(self._gauges)
+        gauges.update(collected)
+        return {
+            'histograms': histograms,
+            'counters': counters,
+            'gauges': [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in gauges.items()],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, default=float)
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+
+    def to_prometheus(self):
+        def fmt_labels(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        collected = self._collected()
+        lines = []
+        with self._lock:
+            for (name, labels), h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{fmt_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_bucket{fmt_labels(labels + (("le", "+Inf"),))} {h.count}')
+                lines.append(f'{name}_sum{fmt_labels(labels)} {h.total}')
+                lines.append(f'{name}_count{fmt_labels(labels)} {h.count}')
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f'{name}{fmt_labels(labels)} {value}')
+            gauges = dict(self._gauges)
+        gauges.update(collected)
+        for (name, labels), value in sorted(gauges.items()):
+            lines.append(f'{name}{fmt_labels(labels)} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler(threading.Thread):
+    """Samples every thread's Python stack every ``interval`` seconds."""
+
+    def __init__(self, interval=0.01, max_depth=64):
+        super().__init__(name='aidly-sampling-profiler', daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Samples in collapsed-stack format (one ``stack count`` per line)."""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+
+def estimate_size(value, _depth=0):
+    """Rough retained size of a session-state value in bytes."""
+    if _depth > 4:
+        return sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(v, _depth + 1) for v in value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + estimate_size(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+registry = MetricsRegistry()
+span = registry.span
+profiler = None
+
+
+def start_profiler(interval=0.01):
+    global profiler
+    if profiler is None:
+        profiler = SamplingProfiler(interval=interval)
+        profiler.start()
+    return profiler
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = registry.to_json(), 'application/json'
+        elif self.path == '/profile' and profiler is not None:
+            body, content_type = profiler.collapsed(), 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve the metrics endpoints from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='aidly-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,188 @@
+"""CPU-only pre-triage that runs before any model call.
+
+Scores a capture on a small grayscale copy (a few milliseconds for a
+1024 px image) so unusable frames are rejected with instant feedback
+instead of after a multi-second Gemini round trip:
+
+- sharpness: variance of the Laplacian; motion blur and missed focus
+  score near zero;
+- exposure: mean brightness and the share of clipped pixels;
+- content: near-uniform frames (lens covered, blank wall) are rejected.
+
+It also computes a 64-bit difference hash (dHash) and a small color
+thumbnail, so near-identical camera captures can reuse an earlier analysis,
+and a region of interest around the high-detail area. prepare_for_upload
+crops to that region and downscales before the image is sent to the model.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Scores are computed on a copy at most this many pixels on a side, which
+# keeps thresholds independent of the capture resolution
+SCORE_SIDE = 256
+UPLOAD_MAX_SIDE = int(os.environ.get('AIDLY_UPLOAD_MAX_SIDE', 768))
+
+MIN_SHARPNESS = float(os.environ.get('AIDLY_PRETRIAGE_MIN_SHARPNESS', 10))
+MIN_BRIGHTNESS = 35
+MAX_BRIGHTNESS = 225
+MAX_CLIPPED = 0.6
+MIN_CONTRAST = 8
+
+# Only crop when the detailed region is clearly smaller than the frame
+ROI_MAX_AREA = 0.7
+ROI_PADDING = 0.1
+
+# dHash bits that may differ between two captures of the same scene; kept
+# tight because reusing another wound's analysis is worse than a model call
+DUPLICATE_DISTANCE = 4
+# The dHash only sees luminance gradients, so a duplicate must also match a
+# THUMBNAIL_SIDE px color thumbnail to within this mean per-channel difference
+THUMBNAIL_SIDE = 16
+MAX_PIXEL_DIFFERENCE = 8
+
+
+class UnusableImage(ValueError):
+    """Raised when a capture is too blurry, badly exposed or empty to analyze."""
+
+
+def _gray(image):
+    gray = image.convert('L')
+    gray.thumbnail((SCORE_SIDE, SCORE_SIDE))
+    return np.asarray(gray, dtype=np.float32)
+
+
+def _laplacian_variance(gray):
+    lap = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * gray[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def dhash(image, size=8):
+    """64-bit difference hash of ``image``."""
+    gray = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def thumbnail(image, side=THUMBNAIL_SIDE):
+    """``side`` x ``side`` RGB copy of ``image`` for pixel-level duplicate checks."""
+    return np.asarray(image.convert('RGB').resize((side, side), Image.BILINEAR), dtype=np.uint8)
+
+
+def pixel_difference(a, b):
+    """Mean absolute per-channel difference between two thumbnails."""
+    return float(np.abs(a.astype(np.int16) - b.astype(np.int16)).mean())
+
+
+def region_of_interest(gray):
+    """``(left, top, right, bottom)`` of the high-detail area as fractions of the frame."""
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    threshold = max(float(np.percentile(magnitude, 90)), 8.0)
+    rows, cols = np.nonzero(magnitude >= threshold)
+    if rows.size == 0:
+        return (0.0, 0.0, 1.0, 1.0)
+    height, width = gray.shape
+    # Percentiles rather than min/max so stray specks do not widen the box
+    top, bottom = np.percentile(rows, (2, 98)) / height
+    left, right = np.percentile(cols, (2, 98)) / width
+    return (
+        max(0.0, float(left) - ROI_PADDING),
+        max(0.0, float(top) - ROI_PADDING),
+        min(1.0, float(right) + ROI_PADDING),
+        min(1.0, float(bottom) + ROI_PADDING),
+    )
+
+
+def assess_image(image):
+    """Score ``image`` and return a report dict.
+
+    ``report['reason']`` is a user-facing explanation when the image should
+    not be analyzed, otherwise None.
+    """
+    gray = _gray(image)
+    brightness = float(gray.mean())
+    contrast = float(gray.std())
+    clipped = float(((gray <= 5) | (gray >= 250)).mean())
+    sharpness = _laplacian_variance(gray)
+
+    reason = None
+    if contrast < MIN_CONTRAST:
+        reason = "The photo looks empty. Make sure the injury is in frame and the lens is not covered."
+    elif brightness < MIN_BRIGHTNESS:
+        reason = "The photo is too dark. Turn on a light or move closer to a window and try again."
+    elif brightness > MAX_BRIGHTNESS or clipped > MAX_CLIPPED:
+        reason = "The photo is overexposed. Avoid direct light on the injury and try again."
+    elif sharpness < MIN_SHARPNESS:
+        reason = "The photo is blurry. Hold the camera steady, tap to focus and try again."
+
+    return {
+        'reason': reason,
+        'sharpness': sharpness,
+        'brightness': brightness,
+        'contrast': contrast,
+        'clipped': clipped,
+        'dhash': dhash(image),
+        'thumbnail': thumbnail(image),
+        'roi': region_of_interest(gray),
+    }
+
+
+def check_image(image):
+    """assess_image, raising UnusableImage for frames that should not be analyzed."""
+    report = assess_image(image)
+    if report['reason'] is not None:
+        raise UnusableImage(report['reason'])
+    return report
+
+
+def prepare_for_upload(image, report, max_side=UPLOAD_MAX_SIDE):
+    """Crop ``image`` to the report's region of interest and downscale it."""
+    left, top, right, bottom = report['roi']
+    if (right - left) * (bottom - top) < ROI_MAX_AREA:
+        width, height = image.size
+        image = image.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+    if max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side))
+    return image
+
+
+class RecentCaptures:
+    """Maps one session's recent captures to analysis cache keys.
+
+    Two photos of the same wound taken a second apart differ byte for byte
+    but not in their dHash, so the second one can be answered from the
+    analysis cache. A match also needs a near-identical color thumbnail,
+    since different wounds can share a luminance-only hash.
+    """
+
+    def __init__(self, max_entries=32, max_distance=DUPLICATE_DISTANCE, max_difference=MAX_PIXEL_DIFFERENCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find(self, image_hash, image_thumbnail):
+        with self._lock:
+            for known, (known_thumbnail, key) in reversed(self._entries.items()):
+                if (hamming(known, image_hash) <= self.max_distance
+                        and pixel_difference(known_thumbnail, image_thumbnail) <= self.max_difference):
+                    return key
+        return None
+
+    def add(self, image_hash, image_thumbnail, key):
+        with self._lock:
+            self._entries[image_hash] = (image_thumbnail, key)
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,148 @@
+"""Severity-aware hospital recommendations for high-severity analyses.
+
+As soon as analyze_injury reports a critical score, the app calls
+prefetch() so nearby facilities are fetched and indexed in a background
+thread while first aid is still streaming. recommend() then ranks them for
+the specific condition:
+
+- a precomputed keyword -> specialty index (data/condition_specialties.json)
+  maps the identified condition to the specialties that treat it
+  (emergency care is covered by the ``emergency`` flag, not a specialty);
+- facilities offering more matching specialties rank first, then those
+  with a 24/7 emergency department, then the nearest, in one vectorized
+  HospitalIndex.within query.
+
+Candidates are cached per location grid cell (fetched from the cell centre
+with a radius that covers the whole cell, and kept as a small HospitalIndex),
+and ranked for each user's exact position, so every nearby user shares one
+fetch.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.hospital_index import KM_PER_DEGREE_LAT, HospitalIndex
+from utils.metrics import registry
+
+CONDITION_SPECIALTIES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'condition_specialties.json'
+)
+
+RECOMMENDATION_RADIUS_KM = 20
+RECOMMENDATION_CELL_DEG = 0.01
+
+
+def _load_condition_index(path=CONDITION_SPECIALTIES_PATH):
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+    return {keyword.lower(): tuple(s.lower() for s in specialties) for keyword, specialties in raw.items()}
+
+
+CONDITION_INDEX = _load_condition_index()
+
+
+def specialties_for(condition):
+    """Lowercased specialties relevant to a condition name, most specific first."""
+    matched = []
+    for word in re.findall(r'[a-z]+', (condition or '').lower()):
+        # Plain suffix stripping is enough for "burns", "fractures", "bites"
+        keywords = [word]
+        if word.endswith('s'):
+            keywords.append(word[:-1])
+        for keyword in keywords:
+            for specialty in CONDITION_INDEX.get(keyword, ()):
+                if specialty not in matched:
+                    matched.append(specialty)
+    return tuple(matched)
+
+
+def _matching_specialties(hospital, wanted):
+    return [s for s in hospital.get('specialties') or [] if s.lower() in wanted]
+
+
+def rank_hospitals(index, lat, lng, condition=None, k=3, radius_km=RECOMMENDATION_RADIUS_KM):
+    """Top ``k`` facilities in a HospitalIndex for ``condition`` as seen from ``(lat, lng)``.
+
+    Returns hospital dicts with ``distance_km``, ``distance``,
+    ``matched_specialties`` and ``directions_url`` set for this location.
+    """
+    wanted = specialties_for(condition)
+    ranked = index.within(lat, lng, radius_km, limit=k, emergency_first=True, specialties=wanted)
+    for hospital in ranked:
+        hospital['matched_specialties'] = _matching_specialties(hospital, set(wanted))
+    return ranked
+
+
+class HospitalRecommender:
+    """Background candidate fetches, cached per location grid cell.
+
+    ``fetch(lat, lng, radius_km)`` returns candidate hospital dicts with
+    ``lat``/``lng``; HospitalIndex.within fits directly. Each cell's
+    candidates are kept as a HospitalIndex of their own.
+    """
+
+    def __init__(self, cell_deg=RECOMMENDATION_CELL_DEG, ttl_seconds=900, max_entries=512, max_workers=2):
+        self.cell_deg = cell_deg
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='aidly-recommend')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _fetch_radius(self, radius_km):
+        # Half the cell diagonal, so every point in the cell is covered
+        return radius_km + self.cell_deg * KM_PER_DEGREE_LAT * math.sqrt(2) / 2
+
+    def prefetch(self, fetch, lat, lng, radius_km=RECOMMENDATION_RADIUS_KM):
+        """Start fetching candidates for the cell containing ``(lat, lng)``; returns a Future."""
+        key = (self._cell(lat, lng), radius_km)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, future = entry
+                failed = future.done() and future.exception() is not None
+                if now - created < self.ttl_seconds and not failed:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return future
+            self.misses += 1
+            row, col = key[0]
+            center_lat = (row + 0.5) * self.cell_deg
+            center_lng = (col + 0.5) * self.cell_deg
+            future = self._executor.submit(self._timed_fetch, fetch, center_lat, center_lng, self._fetch_radius(radius_km))
+            self._entries[key] = (now, future)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return future
+
+    @staticmethod
+    def _timed_fetch(fetch, lat, lng, radius_km):
+        with registry.span('hospital_recommendations_fetch'):
+            candidates = fetch(lat, lng, radius_km)
+            return HospitalIndex([h for h in candidates if 'lat' in h and 'lng' in h])
+
+    def recommend(self, fetch, lat, lng, condition, k=3, radius_km=RECOMMENDATION_RADIUS_KM, timeout=None):
+        """Ranked facilities for ``condition``; waits at most ``timeout`` seconds for the fetch."""
+        index = self.prefetch(fetch, lat, lng, radius_km).result(timeout=timeout)
+        return rank_hospitals(index, lat, lng, condition, k=k, radius_km=radius_km)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
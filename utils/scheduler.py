@@ -0,0 +1,283 @@
+"""Process-wide scheduler for Gemini calls.
+
+Every model call from every session goes through one GeminiScheduler:
+
+- at most ``max_concurrency`` calls run at once; waiting calls are admitted
+  in priority order (critical analyses before chat, chat before background
+  summaries), FIFO within a priority;
+- calls that share a ``key`` while one is in flight are coalesced, and all
+  callers receive the first call's result;
+- rate-limit and transient errors (by exception type or HTTP status) are
+  retried with full-jitter exponential backoff;
+- each call has a deadline that bounds queueing, retries and the call
+  itself.
+
+Each attempt runs on a helper thread and the caller waits for it at most
+until the deadline, so a hung request cannot stall the caller or keep its
+slot. Streaming responses hold their slot while the caller iterates. The
+SDK helpers in utils.gemini_stream also pass remaining_time() to the
+client as the request timeout, so the request itself is cut off as well.
+The model client is the single shared instance from
+utils.gemini_stream.get_model, so connections are reused.
+"""
+import heapq
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, wait
+
+PRIORITY_CRITICAL = 0
+PRIORITY_ANALYSIS = 1
+PRIORITY_CHAT = 2
+PRIORITY_BACKGROUND = 3
+
+RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+# google.api_core exception classes for the same conditions
+RETRYABLE_ERROR_TYPES = frozenset(('TooManyRequests', 'ResourceExhausted', 'InternalServerError',
+                                   'BadGateway', 'ServiceUnavailable', 'GatewayTimeout'))
+
+_call_deadline = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call could not be started or completed before its deadline."""
+
+
+def _status_code(error):
+    for value in (getattr(error, 'code', None), getattr(error, 'status_code', None),
+                  getattr(getattr(error, 'response', None), 'status_code', None)):
+        # google.api_core errors carry an HTTPStatus, requests errors an int
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def is_retryable(error):
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if _status_code(error) in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_TYPES for cls in type(error).__mro__)
+
+
+def remaining_time():
+    """Seconds left for the scheduled call running on this thread, or None outside one."""
+    deadline_at = getattr(_call_deadline, 'at', None)
+    if deadline_at is None:
+        return None
+    return max(0.0, deadline_at - time.monotonic())
+
+
+class GeminiScheduler:
+    def __init__(self, max_concurrency=4, max_retries=3, base_delay=0.5, max_delay=8.0, default_deadline=60.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_deadline = default_deadline
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._in_flight = {}  # key -> Future
+        self._stats = {'calls': 0, 'coalesced': 0, 'retries': 0, 'deadline_exceeded': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _acquire(self, priority, deadline_at):
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while self._active >= self.max_concurrency or self._waiting[0] != ticket:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['deadline_exceeded'] += 1
+                        raise DeadlineExceeded("Timed out waiting for a model slot")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self._active += 1
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt, deadline_at):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline_at:
+            return False
+        self._count('retries')
+        time.sleep(delay)
+        return True
+
+    def call(self, func, *args, priority=PRIORITY_CHAT, key=None, deadline=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` under the scheduler and return its result."""
+        deadline_at = time.monotonic() + (deadline or self.default_deadline)
+
+        if key is not None:
+            with self._cond:
+                future = self._in_flight.get(key)
+                if future is not None:
+                    self._stats['coalesced'] += 1
+                    owner = False
+                else:
+                    future = self._in_flight[key] = Future()
+                    owner = True
+            if not owner:
+                remaining = deadline_at - time.monotonic()
+                try:
+                    return future.result(timeout=max(0.0, remaining))
+                except TimeoutError:
+                    self._count('deadline_exceeded')
+                    raise DeadlineExceeded("Timed out waiting for a coalesced call")
+
+        try:
+            result = self._run(func, args, kwargs, priority, deadline_at)
+        except BaseException as error:
+            if key is not None:
+                self._finish(key, future, error=error)
+            raise
+        if key is not None:
+            self._finish(key, future, result=result)
+        return result
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._cond:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _attempt(self, func, args, kwargs, deadline_at):
+        # Run on a helper thread so a hung request is abandoned at the
+        # deadline instead of blocking the caller and holding the slot
+        future = Future()
+
+        def target():
+            _call_deadline.at = deadline_at
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+
+        threading.Thread(target=target, name='aidly-model-call', daemon=True).start()
+        wait([future], timeout=max(0.0, deadline_at - time.monotonic()))
+        if not future.done():
+            self._count('deadline_exceeded')
+            raise DeadlineExceeded("Model call did not finish before its deadline")
+        return future.result()
+
+    def _run(self, func, args, kwargs, priority, deadline_at):
+        self._count('calls')
+        attempt = 0
+        while True:
+            self._acquire(priority, deadline_at)
+            try:
+                return self._attempt(func, args, kwargs, deadline_at)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    self._count('errors')
+                    raise
+            finally:
+                self._release()
+            if not self._backoff(attempt, deadline_at):
+                self._count('errors')
+                raise DeadlineExceeded("Deadline reached while retrying a model call")
+            attempt += 1
+
+    def stream(self, func, *args, priority=PRIORITY_CHAT, deadline=None, **kwargs):
+        """Iterate ``func(*args, **kwargs)`` while holding a model slot.
+
+        Failures before the first chunk are retried like call(); once output
+        has been yielded, errors propagate to the caller.
+        """
+        deadline_at = time.monotonic() + (deadline or self.default_deadline)
+        self._count('calls')
+        attempt = 0
+        while True:
+            self._acquire(priority, deadline_at)
+            started = False
+            try:
+                for chunk in self._iterate(func, args, kwargs, deadline_at):
+                    started = True
+                    yield chunk
+                return
+            except Exception as error:
+                if started or attempt >= self.max_retries or not is_retryable(error):
+                    self._count('errors')
+                    raise
+            finally:
+                self._release()
+            if not self._backoff(attempt, deadline_at):
+                self._count('errors')
+                raise DeadlineExceeded("Deadline reached while retrying a model stream")
+            attempt += 1
+
+    def _iterate(self, func, args, kwargs, deadline_at):
+        """Yield from ``func(*args, **kwargs)``, produced on a helper thread, until the deadline."""
+        chunks = queue.Queue()
+        stopped = threading.Event()
+        end = object()
+
+        def produce():
+            _call_deadline.at = deadline_at
+            try:
+                for chunk in func(*args, **kwargs):
+                    if stopped.is_set():
+                        return
+                    chunks.put((chunk, None))
+            except BaseException as error:
+                chunks.put((end, error))
+            else:
+                chunks.put((end, None))
+
+        threading.Thread(target=produce, name='aidly-model-stream', daemon=True).start()
+        try:
+            while True:
+                try:
+                    chunk, error = chunks.get(timeout=max(0.0, deadline_at - time.monotonic()))
+                except queue.Empty:
+                    self._count('deadline_exceeded')
+                    raise DeadlineExceeded("Model stream did not finish before its deadline")
+                if chunk is end:
+                    if error is not None:
+                        raise error
+                    return
+                yield chunk
+        finally:
+            # The caller stopped early or gave up: let the producer wind down
+            stopped.set()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, active=self._active, waiting=len(self._waiting))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The shared scheduler, configured from AIDLY_GEMINI_* environment variables."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GeminiScheduler(
+                    max_concurrency=int(os.environ.get('AIDLY_GEMINI_CONCURRENCY', 4)),
+                    max_retries=int(os.environ.get('AIDLY_GEMINI_RETRIES', 3)),
+                    default_deadline=float(os.environ.get('AIDLY_GEMINI_DEADLINE', 60)),
+                )
+    return _scheduler
@@ -0,0 +1,228 @@
+"""Local semantic answer cache for the Emergency Chat tab.
+
+Questions are turned into normalized character n-gram vectors, and a new
+question is answered from the cache when its cosine similarity to a stored
+question clears a threshold. Everything runs on the CPU in a few
+milliseconds. An inverted n-gram index limits scoring to questions that share
+at least one n-gram with the query.
+
+Lexical similarity alone cannot tell "my baby is choking" from "an adult is
+choking", so a match must also share at least one whole word with the query
+and name the same qualifiers (patient group, body part, cause, animal,
+negation; see QUALIFIERS). When they differ, the question goes to the model.
+
+The cache is pre-warmed with curated first aid answers (utils/data/
+first_aid_faq.json). Those entries are never evicted and match in any
+conversation. Learned answers are LRU-bounded, can be persisted to a JSON
+file, and are stored under a context key (e.g. the injury analysis they were
+generated with): they only match a lookup made with the same key.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+FAQ_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'first_aid_faq.json')
+
+STOPWORDS = frozenset("""
+a an the to for of on in at is are am be was were do does did i my me we you
+your it its this that what how should can could would please if with and or
+someone somebody person help
+""".split())
+
+# Words that change which first aid is correct. Each maps to a group; a
+# stored question only matches a query that names exactly the same groups.
+QUALIFIERS = {
+    **dict.fromkeys(('baby', 'babies', 'infant', 'infants', 'newborn'), 'infant'),
+    **dict.fromkeys(('child', 'children', 'kid', 'kids', 'toddler'), 'child'),
+    **dict.fromkeys(('adult', 'adults'), 'adult'),
+    **dict.fromkeys(('pregnant', 'pregnancy'), 'pregnant'),
+    **dict.fromkeys(('elderly',), 'elderly'),
+    **dict.fromkeys(('eye', 'eyes'), 'eye'),
+    **dict.fromkeys(('nose', 'nosebleed', 'nosebleeds'), 'nose'),
+    **dict.fromkeys(('ear', 'ears'), 'ear'),
+    **dict.fromkeys(('mouth', 'tongue', 'teeth', 'tooth'), 'mouth'),
+    **dict.fromkeys(('head', 'skull', 'concussion'), 'head'),
+    **dict.fromkeys(('neck', 'spine', 'spinal'), 'spine'),
+    **dict.fromkeys(('chest',), 'chest'),
+    **dict.fromkeys(('chemical', 'chemicals', 'acid', 'bleach', 'alkali'), 'chemical'),
+    **dict.fromkeys(('electric', 'electrical', 'electricity', 'electrocuted'), 'electric'),
+    **dict.fromkeys(('heat', 'sun', 'sunstroke', 'overheated'), 'heat'),
+    **dict.fromkeys(('stroke',), 'stroke'),
+    **dict.fromkeys(('heart',), 'heart'),
+    **dict.fromkeys(('drowning', 'drowned', 'drown'), 'drowning'),
+    **dict.fromkeys(('snake',), 'snake'),
+    **dict.fromkeys(('dog',), 'dog'),
+    **dict.fromkeys(('cat',), 'cat'),
+    **dict.fromkeys(('monkey',), 'monkey'),
+    **dict.fromkeys(('bee', 'wasp', 'sting'), 'sting'),
+    **dict.fromkeys(('scorpion',), 'scorpion'),
+    **dict.fromkeys(('not', 'no', 'never', 'without'), 'negation'),
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+
+def normalize(text):
+    words = _NON_WORD.sub(" ", text.lower()).split()
+    return [w for w in words if w not in STOPWORDS]
+
+
+def qualifiers(text):
+    """The QUALIFIERS groups ``text`` mentions."""
+    return frozenset(QUALIFIERS[w] for w in _NON_WORD.sub(" ", text.lower()).split() if w in QUALIFIERS)
+
+
+def vectorize(text, n=3):
+    """L2-normalized bag of word unigrams and character n-grams."""
+    counts = Counter()
+    for word in normalize(text):
+        counts['w:' + word] += 2
+        padded = f"#{word}#"
+        for i in range(max(1, len(padded) - n + 1)):
+            counts[padded[i:i + n]] += 1
+    norm = math.sqrt(sum(v * v for v in counts.values()))
+    if not norm:
+        return {}
+    return {k: v / norm for k, v in counts.items()}
+
+
+def context_key(context):
+    """Digest identifying the conversation context an answer was generated from."""
+    if not context:
+        return None
+    return hashlib.blake2b(context.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, path=None, max_entries=1000, threshold=0.75, faq_path=FAQ_PATH, autosave_every=10):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.autosave_every = autosave_every
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._entries = OrderedDict()  # id -> {'question', 'answer', 'vector', 'qualifiers', 'context', 'pinned'}
+        self._postings = {}  # n-gram -> set of entry ids
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+        if faq_path and os.path.exists(faq_path):
+            with open(faq_path, encoding='utf-8') as f:
+                for item in json.load(f):
+                    for question in item['questions']:
+                        self._insert(question, item['answer'], pinned=True)
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for item in json.load(f):
+                    self._insert(item['question'], item['answer'], context=item.get('context'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, question, answer, context=None, pinned=False):
+        entry_id = self._next_id
+        self._next_id += 1
+        vector = vectorize(question)
+        self._entries[entry_id] = {
+            'question': question,
+            'answer': answer,
+            'vector': vector,
+            'qualifiers': qualifiers(question),
+            'context': context,
+            'pinned': pinned,
+        }
+        for gram in vector:
+            self._postings.setdefault(gram, set()).add(entry_id)
+        self._evict()
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for gram in entry['vector']:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def _evict(self):
+        learned = [i for i, e in self._entries.items() if not e['pinned']]
+        while len(learned) > self.max_entries:
+            self._remove(learned.pop(0))
+
+    def _best_match(self, vector, groups, context):
+        scores = Counter()
+        shares_word = set()
+        for gram, weight in vector.items():
+            for entry_id in self._postings.get(gram, ()):
+                entry = self._entries[entry_id]
+                if entry['qualifiers'] != groups:
+                    continue
+                if entry['pinned'] or entry['context'] == context:
+                    scores[entry_id] += weight * entry['vector'][gram]
+                    if gram.startswith('w:'):
+                        shares_word.add(entry_id)
+        for entry_id, score in scores.most_common():
+            if entry_id in shares_word:
+                return entry_id, score
+        return None, 0.0
+
+    def lookup(self, question, threshold=None, context=None):
+        """Return ``(answer, score)`` for the closest stored question, or None.
+
+        Learned answers only match when ``context`` is the same as when they
+        were added.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        vector = vectorize(question)
+        groups = qualifiers(question)
+        context = context_key(context)
+        with self._lock:
+            entry_id, score = self._best_match(vector, groups, context) if vector else (None, 0.0)
+            if entry_id is None or score < threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]['answer'], score
+
+    def add(self, question, answer, context=None):
+        if not vectorize(question):
+            return
+        with self._lock:
+            self._insert(question, answer, context=context_key(context))
+            self._unsaved += 1
+            if self.path and self._unsaved >= self.autosave_every:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        learned = [
+            {'question': e['question'], 'answer': e['answer'], 'context': e['context']}
+            for e in self._entries.values() if not e['pinned']
+        ]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(learned, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
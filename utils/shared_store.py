@@ -0,0 +1,303 @@
+"""State shared between app workers.
+
+In the multi-worker deployment (utils.cluster) each worker is a separate
+process, so anything kept only in st.session_state or in a process-wide
+cache is lost when a browser reconnects to another worker. This module
+keeps the heavy per-session artifacts (image, analysis, chat context,
+hospital results) and the analysis cache in a store every worker can reach:
+
+    AIDLY_SHARED_STORE=sqlite:///.aidly_cache/shared.db   (local, default for utils.cluster)
+    AIDLY_SHARED_STORE=redis://localhost:6379/0           (needs the redis package)
+
+Values are pickled and signed with AIDLY_SHARED_STORE_SECRET (utils.cluster
+sets one per deployment), and blobs without a valid signature are ignored,
+so write access to the store does not let anyone run code in the workers.
+Backends are plain byte stores with per-key TTLs; register_backend adds
+other schemes (any Redis-like service), and a StorePurger thread drops
+expired entries from backends that do not expire keys themselves. Without
+AIDLY_SHARED_STORE the app runs exactly as a single process.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from utils.analysis_cache import AnalysisCache
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = int(os.environ.get('AIDLY_SESSION_TTL', 24 * 3600))
+SIGNATURE_BYTES = 32
+
+
+class InvalidSignature(ValueError):
+    """Raised for a shared store blob that was not written by this deployment."""
+
+
+_signing_key = None
+_signing_key_lock = threading.Lock()
+
+
+def signing_key():
+    """HMAC key for shared store values, from AIDLY_SHARED_STORE_SECRET."""
+    global _signing_key
+    if _signing_key is None:
+        with _signing_key_lock:
+            if _signing_key is None:
+                secret = os.environ.get('AIDLY_SHARED_STORE_SECRET')
+                if secret:
+                    _signing_key = secret.encode()
+                else:
+                    # Nothing another process wrote will verify, so the
+                    # store only serves this process
+                    logger.warning("AIDLY_SHARED_STORE_SECRET is not set; shared entries are private to this process")
+                    _signing_key = secrets.token_bytes(32)
+    return _signing_key
+
+
+def dumps(value):
+    """Pickle ``value`` and prefix the HMAC-SHA256 of the pickle."""
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return hmac.new(signing_key(), blob, hashlib.sha256).digest() + blob
+
+
+def loads(signed):
+    """Inverse of dumps; raises InvalidSignature before unpickling anything unsigned."""
+    signature, blob = signed[:SIGNATURE_BYTES], signed[SIGNATURE_BYTES:]
+    if not hmac.compare_digest(signature, hmac.new(signing_key(), blob, hashlib.sha256).digest()):
+        raise InvalidSignature("shared store entry has no valid signature")
+    return pickle.loads(blob)
+
+
+def session_key(browser_id, tab_id):
+    """Shared store id of one browser tab's session."""
+    return hashlib.blake2b(f'{browser_id}:{tab_id}'.encode(), digest_size=16).hexdigest()
+
+
+class SQLiteStore:
+    """Byte store in a local SQLite file; safe across processes on one host."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        expires = time.time() + ttl_seconds if ttl_seconds else None
+        self._conn().execute(
+            'INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)', (key, value, expires)
+        )
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        self._conn().execute('DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?', (time.time(),))
+
+
+class RedisStore:
+    """Byte store in Redis (or anything speaking its protocol)."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The Redis shared store needs the redis package: pip install redis")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl_seconds=None):
+        self._client.set(key, value, ex=int(ttl_seconds) if ttl_seconds else None)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def purge_expired(self):
+        # Redis expires keys itself
+        pass
+
+
+BACKENDS = {
+    # sqlite:///relative/path or sqlite:////absolute/path
+    'sqlite': lambda url: SQLiteStore(url[len('sqlite:///'):]),
+    'redis': RedisStore,
+    'rediss': RedisStore,
+}
+
+
+def register_backend(scheme, factory):
+    """Make ``factory(url)`` available for AIDLY_SHARED_STORE URLs with ``scheme``."""
+    BACKENDS[scheme] = factory
+
+
+def open_store(url):
+    scheme = urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ValueError(f"Unsupported shared store URL: {url}")
+    return BACKENDS[scheme](url)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """The store configured by AIDLY_SHARED_STORE, or None in single-process mode."""
+    global _store
+    url = os.environ.get('AIDLY_SHARED_STORE')
+    if not url:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_store(url)
+    return _store
+
+
+class StorePurger(threading.Thread):
+    """Daemon thread that purges expired entries every ``interval_seconds``."""
+
+    def __init__(self, store, interval_seconds=600):
+        super().__init__(name='shared-store-purger', daemon=True)
+        self.store = store
+        self.interval = interval_seconds
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.store.purge_expired()
+            except Exception:
+                # Expired entries are already ignored on read; they only take space
+                logger.exception("Shared store purge failed")
+
+
+class SessionSync:
+    """Mirrors selected session state keys to the shared store.
+
+    save() only writes keys whose pickled value changed since the last save
+    or restore, so calling it on every rerun costs a pickle and a hash per
+    key, not a write.
+    """
+
+    def __init__(self, store, session_id, keys, ttl_seconds=SESSION_TTL_SECONDS):
+        self.store = store
+        self.session_id = session_id
+        self.keys = keys
+        self.ttl_seconds = ttl_seconds
+        self._digests = {}
+
+    def _key(self, name):
+        return f'session:{self.session_id}:{name}'
+
+    def owner(self):
+        """The ``worker:session`` that last claimed this session, or None."""
+        value = self.store.get(self._key('owner'))
+        return value.decode() if value is not None else None
+
+    def claim(self, owner):
+        self.store.set(self._key('owner'), owner.encode(), self.ttl_seconds)
+
+    def restore(self):
+        """Saved values for this session, as ``{key: value}``."""
+        values = {}
+        for name in self.keys:
+            blob = self.store.get(self._key(name))
+            if blob is None:
+                continue
+            try:
+                values[name] = loads(blob)
+            except Exception:
+                # Unsigned, or written by another deployment or version of the app
+                continue
+            self._digests[name] = hashlib.blake2b(blob, digest_size=16).digest()
+        return values
+
+    def save(self, state):
+        for name in self.keys:
+            if name not in state:
+                continue
+            blob = dumps(state[name])
+            digest = hashlib.blake2b(blob, digest_size=16).digest()
+            if self._digests.get(name) == digest:
+                continue
+            self.store.set(self._key(name), blob, self.ttl_seconds)
+            self._digests[name] = digest
+
+
+class SharedAnalysisCache(AnalysisCache):
+    """AnalysisCache backed by the shared store.
+
+    The local LRU answers repeat lookups without a round trip; misses fall
+    through to the store, so an image analyzed by one worker is a cache hit
+    on every other.
+    """
+
+    def __init__(self, store, max_entries=256, ttl_seconds=6 * 3600):
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.store = store
+        self.shared_hits = 0
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is not None:
+            return entry
+        blob = self.store.get(f'analysis:{key}')
+        if blob is None:
+            return None
+        try:
+            analysis_result, first_aid = loads(blob)
+        except InvalidSignature:
+            return None
+        super().put(key, analysis_result, first_aid)
+        with self._lock:
+            self.shared_hits += 1
+            # The local miss was answered after all
+            self.misses -= 1
+            self.hits += 1
+        return analysis_result, first_aid
+
+    def put(self, key, analysis_result, first_aid):
+        super().put(key, analysis_result, first_aid)
+        self.store.set(f'analysis:{key}', dumps((analysis_result, first_aid)), self.ttl_seconds)
+
+    def stats(self):
+        stats = super().stats()
+        stats['shared_hits'] = self.shared_hits
+        return stats